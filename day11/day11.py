@@ -371,50 +371,65 @@
 # the first step during which all octopuses flash?
 
 
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from digit_grid import load_digit_grid  # noqa: E402
+
+# bulk energy changes, add one to everything / reset the flashed (10) to 0
+ADD_ONE = bytes((x + 1) % 256 for x in range(256))
+RESET_FLASHED = bytes(0 if 10 == x else x for x in range(256))
+
+
 class OctopusField:
     def __init__(self) -> None:
-        self.grid = dict()
+        # energy levels, row by row, so (x, y) is at y * width + x
+        self.energy = bytearray()
+        # and the indexes of every octopus's neighbours
+        self.neighbours = []
+        self.width = 0
+        self.height = 0
         self.min_x = 0
         self.min_y = 0
         self.max_x = 0
         self.max_y = 0
         self.flashes = 0
 
-    def store_octopus(self, x, y, light_value):
-        """
-        Store one octopus
-        """
-        if x < self.min_x:
-            self.min_x = x
-        if x > self.max_x:
-            self.max_x = x
-        if y < self.min_y:
-            self.min_y = y
-        if y > self.max_y:
-            self.max_y = y
-        self.grid[(x, y)] = light_value
-
     def __repr__(self) -> str:
         result = f"OctopusField <{self.max_x-self.min_x+1}x{self.max_y-self.min_y+1}>\n"
-        for y in range(self.min_y, self.max_y + 1):
-            s = ""
-            for x in range(self.min_x, self.max_x + 1):
-                s += str(self.grid[(x, y)])
-            result += f"{s}\n"
+        for y in range(self.height):
+            row = self.energy[y * self.width : (y + 1) * self.width]
+            result += "".join(str(light) for light in row) + "\n"
         return result
 
     def load_file(self, filename: str):
         """
         Load the octopus field from the file specified
         """
-        with open(filename, "r") as f:
-            y = 0
-            for this_line in f:
-                this_line = this_line.strip()
-                if "" != this_line:
-                    for x, light in enumerate(this_line):
-                        self.store_octopus(x, y, int(light))
-                    y += 1
+        self.load_buffer(*load_digit_grid(filename))
+
+    def load_buffer(self, buffer: bytes, width: int, height: int):
+        """
+        Load the octopus field from a flat buffer of light values, row by row
+        """
+        self.energy = bytearray(buffer)
+        self.width = width
+        self.height = height
+        self.max_x = width - 1
+        self.max_y = height - 1
+
+        # work out everyone's neighbours once, rather than every flash
+        self.neighbours = []
+        for idx in range(len(self.energy)):
+            y, x = divmod(idx, width)
+            self.neighbours.append(
+                tuple(
+                    n_y * width + n_x
+                    for n_x, n_y in OctopusField.generate_neighbours((x, y))
+                    if 0 <= n_x < width and 0 <= n_y < height
+                )
+            )
 
     def generate_neighbours(start_location):
         """
@@ -428,49 +443,47 @@ class OctopusField:
                     result.append((x + xdiff, y + ydiff))
         return result
 
-    def flash_location(self, the_location, amount_to_increment, flashed_this_round):
-        """
-        Increment the specified location by the specified amount
-        if it is now bigger than 9 then it's time to flash..
-        """
-        if the_location not in flashed_this_round and the_location in self.grid:
-            self.grid[the_location] += amount_to_increment
-            if self.grid[the_location] > 9:
-                # FLASH!
-                flashed_this_round.add(the_location)
-                neighbours = OctopusField.generate_neighbours(the_location)
-                for this_neighbour in neighbours:
-                    self.flash_location(this_neighbour, 1, flashed_this_round)
-
     def cycle_once(self):
         """
         Increase all the octopi and let them flash..
+        An octopus flashes as it reaches 10 and then stays at 10, so each one
+        only goes on the queue of flashes to spread once per cycle.
         """
         # 1) Increase everything
-        for this_location in self.grid:
-            self.grid[this_location] += 1
+        energy = self.energy.translate(ADD_ONE)
+        self.energy = energy
 
         # 2) Flash everything that needs to flash..
-        flashed_this_round = set()
-        for this_location in self.grid:
-            self.flash_location(this_location, 0, flashed_this_round)
+        to_flash = []
+        idx = energy.find(10)
+        while -1 != idx:
+            to_flash.append(idx)
+            idx = energy.find(10, idx + 1)
+
+        neighbours = self.neighbours
+        while to_flash:
+            for this_neighbour in neighbours[to_flash.pop()]:
+                if energy[this_neighbour] < 10:
+                    energy[this_neighbour] += 1
+                    if 10 == energy[this_neighbour]:
+                        to_flash.append(this_neighbour)
 
         # 3) add that to the flash count
-        self.flashes += len(flashed_this_round)
+        flashed_this_round = energy.count(10)
+        self.flashes += flashed_this_round
 
         # 4) Reset all the flashed octopuses to 0
-        for this_location in flashed_this_round:
-            self.grid[this_location] = 0
+        self.energy = energy.translate(RESET_FLASHED)
 
         # and return how many were changed
-        return len(flashed_this_round)
+        return flashed_this_round
 
     def cycle_until_synch(self):
         """
         Cycle the octopuses until they synchronise
         """
         iteration = 1
-        total_octupuses = len(self.grid)
+        total_octupuses = len(self.energy)
         changed_this_time = self.cycle_once()
         while changed_this_time != total_octupuses:
             # go again..
@@ -76,10 +76,15 @@
 # THINKING: bet part2 is run a ridiculous number of these.. but for now, the simple way
 
 
+from typing import Dict, Iterator, List
+
+
 class Polymer:
     def __init__(self) -> None:
         self.poly = ""
         self.rules = dict()
+        # lengths[d][pair] is the length of pair after d steps, less its last char
+        self.lengths = []
 
     def __repr__(self) -> str:
         return f"Polymer:{self.poly}"
@@ -96,9 +101,11 @@ class Polymer:
                         pair = parts[0].strip()
                         result = parts[1].strip()
                         self.rules[pair] = result
+                        self.lengths = []
                     else:
                         # must be the polymer
                         self.poly = this_line
+                        self.lengths = []
 
     def naive_step(self):
         """
@@ -117,6 +124,7 @@ class Polymer:
         # and we're done..
         # print(f"{this_poly} -> {next_poly}")
         self.poly = next_poly
+        self.lengths = []
 
     def step(self):
         """
@@ -140,6 +148,86 @@ class Polymer:
         # and we're done..
         # print(f"{this_poly} -> {next_poly}")
         self.poly = "".join(next_poly)
+        self.lengths = []
+
+    def expand(self, steps: int) -> Iterator[str]:
+        """
+        Yield the polymer after this many steps one character at a time,
+        without ever building it. Each pair is expanded depth first off a stack
+        that only ever holds about steps entries.
+        """
+        for x in range(len(self.poly) - 1):
+            stack = [(self.poly[x : x + 2], steps)]
+            while stack:
+                pair, depth = stack.pop()
+                if 0 == depth or pair not in self.rules:
+                    # the last char belongs to whatever comes next
+                    yield pair[0]
+                else:
+                    new_bit = self.rules[pair]
+                    stack.append((new_bit + pair[1], depth - 1))
+                    stack.append((pair[0] + new_bit, depth - 1))
+        if self.poly:
+            yield self.poly[-1]
+
+    def pair_lengths(self, steps: int) -> List[Dict[str, int]]:
+        """
+        How long each pair grows, less its last character, for each number of
+        steps up to this one. Worked out once and kept.
+        """
+        if not self.lengths:
+            # the template's pairs and everything the rules can make, even
+            # the ones without a rule of their own
+            pairs = set(self.rules)
+            for pair, new_bit in self.rules.items():
+                pairs.add(pair[0] + new_bit)
+                pairs.add(new_bit + pair[1])
+            for x in range(len(self.poly) - 1):
+                pairs.add(self.poly[x : x + 2])
+            self.lengths.append({pair: 1 for pair in pairs})
+        while len(self.lengths) <= steps:
+            previous = self.lengths[-1]
+            these_lengths = dict()
+            for pair, length in previous.items():
+                if pair in self.rules:
+                    new_bit = self.rules[pair]
+                    length = previous[pair[0] + new_bit] + previous[new_bit + pair[1]]
+                these_lengths[pair] = length
+            self.lengths.append(these_lengths)
+        return self.lengths
+
+    def char_at(self, position: int, steps: int) -> str:
+        """
+        The character at this (0 based) position after this many steps.
+        Skips whole pairs using their lengths, then goes down one side or the
+        other of each insertion until we get to the character itself.
+        """
+        if position < 0:
+            raise IndexError("Position is before the start of the polymer")
+        lengths = self.pair_lengths(steps)
+        for x in range(len(self.poly) - 1):
+            pair = self.poly[x : x + 2]
+            pair_length = lengths[steps][pair]
+            if position >= pair_length:
+                position -= pair_length
+                continue
+            # it's inside this pair
+            for depth in range(steps, 0, -1):
+                if pair not in self.rules:
+                    break
+                new_bit = self.rules[pair]
+                left_pair = pair[0] + new_bit
+                left_length = lengths[depth - 1][left_pair]
+                if position < left_length:
+                    pair = left_pair
+                else:
+                    position -= left_length
+                    pair = new_bit + pair[1]
+            return pair[0]
+
+        if 0 == position and self.poly:
+            return self.poly[-1]
+        raise IndexError("Position is past the end of the polymer")
 
     def element_counts(self):
         """
@@ -76,14 +76,64 @@
 # THINKING: bet part2 is run a ridiculous number of these.. but for now, the simple way
 
 
-from typing import Dict, Tuple
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class MeltCache:
+    """
+    Least-recently-used store for Melter results, max_size of None means it
+    can grow forever. Keeps count of hits, misses and evictions so the size
+    can be tuned.
+    """
+
+    def __init__(self, max_size: Optional[int] = None) -> None:
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __repr__(self) -> str:
+        return (
+            f"MeltCache<size={len(self)}, max_size={self.max_size}, hits={self.hits}, "
+            f"misses={self.misses}, evictions={self.evictions}>"
+        )
+
+    def get(self, key: Tuple):
+        """
+        Return the cached value, or None if we don't have it
+        """
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: Tuple, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if self.max_size is not None and len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
 
 
 class Melter:
-    def __init__(self, rules) -> None:
+    def __init__(
+        self, rules, cache: Optional[MeltCache] = None, compact: bool = False
+    ) -> None:
         # this is byref, don't care, read-only here..
         self.rules = rules
-        self.cache = dict()
+        self.cache = cache if cache is not None else MeltCache()
+        # compact mode keeps counts as tuples in alphabet order rather than dicts
+        self.alphabet = None
+        if compact:
+            self.alphabet = sorted(set("".join(rules)) | set(rules.values()))
+            self.alphabet_index = {e: idx for idx, e in enumerate(self.alphabet)}
 
     def dict_merge(a: Dict, b: Dict) -> Dict:
         result = a.copy()
@@ -110,30 +160,151 @@ class Melter:
         """
         Melt a single pair X times.. and return the counts of all the elements involved
         """
+        result = self.melt_counts(the_pair, depth)
+        if self.alphabet is not None:
+            result = {e: count for e, count in zip(self.alphabet, result) if count}
+        return result
+
+    def melt_counts(self, the_pair: str, depth: int):
+        """
+        Same as melt() but in whichever form the cache holds
+        """
         key = Melter.cache_key(the_pair, depth)
-        if key in self.cache:
-            # print(f"Using a cached result for {key}")
-            result = self.cache[key]
-        else:
+        result = self.cache.get(key)
+        if result is None:
             # we need to calculate it and cache the result, but this is nicely recursive
             this_level_answer = self.rules[the_pair]
             # do we need to go lower ?
             if depth > 1:
                 left_pair = the_pair[0] + this_level_answer
                 right_pair = this_level_answer + the_pair[1]
-                lhs = self.melt(left_pair, depth - 1)
-                rhs = self.melt(right_pair, depth - 1)
+                lhs = self.melt_counts(left_pair, depth - 1)
+                rhs = self.melt_counts(right_pair, depth - 1)
                 # remember to lose the middle duplication..
-                result = Melter.dict_merge(lhs, rhs)
-                result[this_level_answer] -= 1
+                if self.alphabet is None:
+                    result = Melter.dict_merge(lhs, rhs)
+                    result[this_level_answer] -= 1
+                else:
+                    merged = [x + y for x, y in zip(lhs, rhs)]
+                    merged[self.alphabet_index[this_level_answer]] -= 1
+                    result = tuple(merged)
             else:
-                result = Melter.dict_from_string(
-                    the_pair[0] + this_level_answer + the_pair[1]
-                )
+                melted = the_pair[0] + this_level_answer + the_pair[1]
+                if self.alphabet is None:
+                    result = Melter.dict_from_string(melted)
+                else:
+                    result = tuple(melted.count(e) for e in self.alphabet)
             # cache that sucker for next time
-            # print(f"Storing a cached result for {key}")
-            self.cache[key] = result
+            self.cache.put(key, result)
+
+        return result
 
+
+class PairMatrix:
+    """
+    Another way round, the polymer is just a count of each pair in it and
+    each step every pair AB turns into the pairs AC and CB. That's a linear
+    map, so it can be written as a matrix and N steps are the matrix to the
+    power N, which only needs log N squarings.
+    """
+
+    def __init__(self, rules: Dict[str, str]) -> None:
+        self.rules = rules
+        # every pair we could ever see, anything without a rule just stays put
+        pairs = set(rules)
+        for pair, insert in rules.items():
+            pairs.add(pair[0] + insert)
+            pairs.add(insert + pair[1])
+        self.pairs = sorted(pairs)
+        self.pair_index = {pair: idx for idx, pair in enumerate(self.pairs)}
+
+        # transitions[new][old] is how many new pairs each old pair makes
+        size = len(self.pairs)
+        self.transitions = [[0] * size for _ in range(size)]
+        for old_idx, pair in enumerate(self.pairs):
+            if pair in rules:
+                insert = rules[pair]
+                for new_pair in (pair[0] + insert, insert + pair[1]):
+                    self.transitions[self.pair_index[new_pair]][old_idx] += 1
+            else:
+                self.transitions[old_idx][old_idx] += 1
+
+    def add_pairs(self, pairs: Iterable[str]):
+        """
+        Make room for pairs that no rule mentions (from a template, say),
+        they have no rule so each one just maps to itself
+        """
+        for pair in pairs:
+            if pair in self.pair_index:
+                continue
+            self.pair_index[pair] = len(self.pairs)
+            self.pairs.append(pair)
+            for row in self.transitions:
+                row.append(0)
+            self.transitions.append([0] * len(self.pairs))
+            self.transitions[-1][-1] = 1
+
+    def multiply(
+        a: List[List[int]], b: List[List[int]], modulus: Optional[int] = None
+    ) -> List[List[int]]:
+        columns = list(zip(*b))
+        result = [
+            [sum(x * y for x, y in zip(row, col)) for col in columns] for row in a
+        ]
+        if modulus is not None:
+            result = [[x % modulus for x in row] for row in result]
+        return result
+
+    def apply(
+        matrix: List[List[int]], vector: List[int], modulus: Optional[int] = None
+    ) -> List[int]:
+        result = [sum(x * y for x, y in zip(row, vector)) for row in matrix]
+        if modulus is not None:
+            result = [x % modulus for x in result]
+        return result
+
+    def pair_counts(
+        self, template: str, steps: int, modulus: Optional[int] = None
+    ) -> List[int]:
+        """
+        How many of each pair (in self.pairs order) after this many steps
+        The polymer roughly doubles every step, so for really big step counts
+        pass a modulus to get the counts modulo that instead
+        """
+        template_pairs = [template[x : x + 2] for x in range(len(template) - 1)]
+        self.add_pairs(template_pairs)
+        counts = [0] * len(self.pairs)
+        for pair in template_pairs:
+            counts[self.pair_index[pair]] += 1
+
+        # binary powers of the transitions, applying the ones we need
+        power = self.transitions
+        while steps:
+            if steps & 1:
+                counts = PairMatrix.apply(power, counts, modulus)
+            steps >>= 1
+            if steps:
+                power = PairMatrix.multiply(power, power, modulus)
+        return counts
+
+    def element_counts(
+        self, template: str, steps: int, modulus: Optional[int] = None
+    ) -> Dict[str, int]:
+        """
+        Each element is the first half of exactly one pair, apart from the
+        very last one which never changes
+        """
+        if not template:
+            return dict()
+        result = {template[-1]: 1}
+        counts = self.pair_counts(template, steps, modulus)
+        for pair, count in zip(self.pairs, counts):
+            # pairs that never turn up aren't elements of this polymer (with a
+            # modulus a count that wraps to exactly 0 gets dropped as well)
+            if count:
+                result[pair[0]] = result.get(pair[0], 0) + count
+        if modulus is not None:
+            result = {element: count % modulus for element, count in result.items()}
         return result
 
 
@@ -170,7 +341,12 @@ class Polymer:
             result += result - 1
         return result
 
-    def one_small_step_for_man(self, desired_iterations: int):
+    def one_small_step_for_man(
+        self,
+        desired_iterations: int,
+        cache_size: Optional[int] = None,
+        compact: bool = False,
+    ):
         """
         The idea is that we can already tell how big the result needs to be
         We also know where each element should sit in that final array already
@@ -187,7 +363,7 @@ class Polymer:
 
         And that was a neat idea, but actually we run out of memory very quickly, thinking we might need counts of the characters rather than storing the strings..
         """
-        melter = Melter(self.rules)
+        melter = Melter(self.rules, MeltCache(cache_size), compact)
 
         # lazy for loop is fine across the top level, an irrelevance
         start_length = len(self.poly)
@@ -207,6 +383,8 @@ class Polymer:
         for x in self.poly[1:-1]:
             final_counts[x] -= 1
 
+        print(f"Melter cache: {melter.cache}")
+
         # and we're done..
         return final_counts
 
@@ -217,7 +395,7 @@ def partx(filename: str, iterations: int) -> int:
     print(poly)
 
     # do all the iterations in one go..
-    elements = poly.one_small_step_for_man(iterations)
+    elements = PairMatrix(poly.rules).element_counts(poly.poly, iterations)
 
     print(elements)
     frequencies = elements.values()
@@ -173,82 +173,142 @@
 # Using the full map, what is the lowest total risk of any path from the top left to the bottom right?
 
 
+import heapq
+import os
+import sys
+from array import array
 from typing import Dict, List
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from digit_grid import load_digit_grid  # noqa: E402
+
+# risk wrap tables, WRAP_BY[n] adds n to a risk level of 1-9 and wraps above 9
+WRAP_BY = [
+    bytes.maketrans(
+        bytes(range(1, 10)), bytes((v + n - 1) % 9 + 1 for v in range(1, 10))
+    )
+    for n in range(9)
+]
+
 
 class MapThing:
     def __init__(self) -> None:
         self.reset()
 
     def reset(self):
-        self.grid = dict()
+        # one byte per location of the base tile, row-major, so (x, y) lives
+        # at y * tile_width + x
+        self.grid = array("B")
+        self.tile_width = 0
+        self.tile_height = 0
+        # the map is the base tile repeated this many times, see scale()
+        self.x_scale = 1
+        self.y_scale = 1
+        self.width = 0
+        self.height = 0
         self.min_x = 0
         self.max_x = -1
         self.min_y = 0
         self.max_y = -1
 
+    def set_size(self, width: int, height: int):
+        """
+        Record the dimensions of the base tile
+        """
+        self.tile_width = width
+        self.tile_height = height
+        self.update_bounds()
+
+    def update_bounds(self):
+        self.width = self.tile_width * self.x_scale
+        self.height = self.tile_height * self.y_scale
+        self.max_x = self.width - 1
+        self.max_y = self.height - 1
+
+    def is_tiled(self) -> bool:
+        return 1 != self.x_scale or 1 != self.y_scale
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def danger_at(self, x: int, y: int) -> int:
+        """
+        Work out the danger from the base tile, each tile right or down adds 1
+        and anything over 9 wraps back around to 1
+        """
+        x_mul, base_x = divmod(x, self.tile_width)
+        y_mul, base_y = divmod(y, self.tile_height)
+        base = self.grid[base_y * self.tile_width + base_x]
+        return (base + x_mul + y_mul - 1) % 9 + 1
+
     def print(self):
         """
         Just simple output..
         """
         print(f"MapThing {self.max_x-self.min_x + 1}x{self.max_y - self.min_y + 1}")
         for y in range(self.min_y, self.max_y + 1):
-            s = ""
-            for x in range(self.min_x, self.max_x + 1):
-                s += str(self.grid[(x, y)])
-            print(s)
+            print("".join(str(self.danger_at(x, y)) for x in range(self.width)))
 
     def scale(self, x_scale, y_scale):
         """
         Scale up the cavern using the part2 logic
+        Nothing is copied, the tiles are worked out on demand by danger_at()
         """
-        # grab the existing grid as a template
-        existing_grid = self.grid
-        # and calculate the width and height
-        grid_width = self.max_x - self.min_x + 1
-        grid_height = self.max_y - self.min_y + 1
+        if self.is_tiled():
+            # tiles of tiles don't bump the same way, flatten the current view first
+            self.materialise()
+        self.x_scale = x_scale
+        self.y_scale = y_scale
+        self.update_bounds()
+
+    def materialise(self):
+        """
+        Expand the tiles into a real grid, returning to a single 1x1 tile
+        """
+        existing_grid = self.grid.tobytes()
+        grid_width = self.tile_width
+        grid_height = self.tile_height
+        x_scale = self.x_scale
+        y_scale = self.y_scale
 
         # reset to clean
         self.reset()
 
-        # multiply out each location
-        for location, base_danger in existing_grid.items():
-            base_x, base_y = location
-            for x_mul in range(x_scale):
-                for y_mul in range(y_scale):
-                    this_x = base_x + grid_width * x_mul
-                    this_y = base_y + grid_height * y_mul
-                    this_danger = base_danger + x_mul + y_mul
-                    while this_danger > 9:
-                        this_danger -= 9
-                    self.store_danger(this_x, this_y, this_danger)
+        # build each output row from the matching template row, bumped and
+        # wrapped once per tile to the right
+        for y_mul in range(y_scale):
+            for base_y in range(grid_height):
+                row_start = base_y * grid_width
+                base_row = existing_grid[row_start : row_start + grid_width]
+                for x_mul in range(x_scale):
+                    bumped = base_row.translate(WRAP_BY[(x_mul + y_mul) % 9])
+                    self.grid.frombytes(bumped)
+
+        self.set_size(grid_width * x_scale, grid_height * y_scale)
 
     def store_danger(self, x: int, y: int, danger_level: int):
         """
-        Add this to the map
+        Update a location already on the map
         """
-        self.grid[(x, y)] = danger_level
-        if x > self.max_x:
-            self.max_x = x
-        if x < self.min_x:
-            self.min_x = x
-        if y > self.max_y:
-            self.max_y = y
-        if y < self.min_y:
-            self.min_y = y
+        if self.is_tiled():
+            raise ValueError("Cannot update a tiled map, materialise() it first")
+        if not self.in_bounds(x, y):
+            raise ValueError(f"({x},{y}) is not on the {self.width}x{self.height} map")
+        self.grid[y * self.width + x] = danger_level
 
     def load_file(self, filename: str):
         """
         Load the map from the file
         """
-        with open(filename, "r") as f:
-            y = 0
-            for this_line in f:
-                this_line = this_line.strip()
-                if "" != this_line:
-                    for x, the_val in enumerate(this_line):
-                        self.store_danger(x, y, int(the_val))
-                    y += 1
+        self.load_buffer(*load_digit_grid(filename))
+
+    def load_buffer(self, buffer: bytes, width: int, height: int):
+        """
+        Load the map from a flat buffer of risk levels, row by row
+        """
+        self.reset()
+        self.grid.frombytes(buffer)
+        self.set_size(width, height)
 
     def neighbours_of(x: int, y: int):
         result = [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]
@@ -266,7 +326,8 @@ class MapThing:
 
         # Start it off with a single seed
         risk_from_here = dict()
-        risk_from_here[(self.max_x, self.max_y)] = self.grid[(self.max_x, self.max_y)]
+        end_danger = self.danger_at(self.max_x, self.max_y)
+        risk_from_here[(self.max_x, self.max_y)] = end_danger
 
         # loop until we have no improvements
         modified = True
@@ -288,7 +349,7 @@ class MapThing:
                     # get the best neighbour score
                     if 0 != len(neighbours):
                         best_neighbour = min(neighbours)
-                        best_total = best_neighbour + self.grid[key]
+                        best_total = best_neighbour + self.danger_at(x, y)
                         if (
                             key not in risk_from_here
                             or best_total < risk_from_here[key]
@@ -307,6 +368,82 @@ class MapThing:
 
         return lowest_risk
 
+    def find_lowest_risk(self, use_heuristic: bool = False) -> int:
+        """
+        Priority queue approach, always expand the cheapest known location next.
+        That is Dijkstra, or A* when use_heuristic is set, in which case the
+        queue is ordered by risk so far plus the manhattan distance to the end.
+        Every step costs at least 1 so that distance never overestimates.
+
+        Locations are handled as flat indexes over the whole (tiled) map.
+        The number of locations expanded is kept in self.nodes_expanded
+        """
+        width = self.width
+        size = width * self.height
+        end = size - 1
+        end_x, end_y = self.max_x, self.max_y
+
+        def estimate(index: int) -> int:
+            if use_heuristic:
+                y, x = divmod(index, width)
+                return (end_x - x) + (end_y - y)
+            return 0
+
+        if self.is_tiled():
+
+            def danger_of(index: int) -> int:
+                y, x = divmod(index, width)
+                return self.danger_at(x, y)
+
+        else:
+            danger_of = self.grid.__getitem__
+
+        # (estimated total, risk so far, index)
+        queue = [(estimate(0), 0, 0)]
+        unreached = 0xFFFFFFFF
+        best_risk = array("I", [unreached]) * size
+        best_risk[0] = 0
+        done = bytearray(size)
+        self.nodes_expanded = 0
+
+        lowest_risk = None
+        while queue:
+            _, risk_so_far, index = heapq.heappop(queue)
+            if done[index]:
+                # stale entry, we already found a better way here
+                continue
+            done[index] = 1
+            self.nodes_expanded += 1
+
+            if index == end:
+                lowest_risk = risk_so_far
+                break
+
+            x = index % width
+            neighbours = []
+            if x > 0:
+                neighbours.append(index - 1)
+            if x < end_x:
+                neighbours.append(index + 1)
+            if index >= width:
+                neighbours.append(index - width)
+            if index + width < size:
+                neighbours.append(index + width)
+
+            for neighbour in neighbours:
+                if done[neighbour]:
+                    continue
+                this_risk = risk_so_far + danger_of(neighbour)
+                if this_risk < best_risk[neighbour]:
+                    best_risk[neighbour] = this_risk
+                    heapq.heappush(
+                        queue, (this_risk + estimate(neighbour), this_risk, neighbour)
+                    )
+
+        mode = "A*" if use_heuristic else "dijkstra"
+        print(f"find_lowest_risk ({mode}): {self.nodes_expanded} nodes expanded")
+        return lowest_risk
+
     def find_safest(
         self,
         x: int,
@@ -321,10 +458,10 @@ class MapThing:
         key = (x, y)
 
         # 0) Are we off the grid ?
-        if key not in self.grid:
+        if not self.in_bounds(x, y):
             return
 
-        this_danger = danger_so_far + self.grid[key]
+        this_danger = danger_so_far + self.danger_at(x, y)
 
         # and are we just wating our time ?
         if this_danger >= self.best_danger:
@@ -400,7 +537,7 @@ def part1(filename: str) -> int:
     cavern = MapThing()
     cavern.load_file(filename)
     cavern.print()
-    safest_route = cavern.score_all_routes()
+    safest_route = cavern.find_lowest_risk(use_heuristic=True)
 
     return safest_route
 
@@ -414,7 +551,7 @@ def part2(filename: str) -> int:
     cavern.print()
     cavern.scale(5, 5)
     cavern.print()
-    safest_route = cavern.score_all_routes()
+    safest_route = cavern.find_lowest_risk(use_heuristic=True)
 
     return safest_route
 
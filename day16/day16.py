@@ -119,7 +119,10 @@
 # Decode the structure of your hexadecimal-encoded BITS transmission; what do you get if you add up the version numbers in all packets?
 
 
-from typing import List
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
 
 
 class HexBinaryThingy:
@@ -202,6 +205,74 @@ class HexBinaryThingy:
         self.idx += bit_count
         return result
 
+    def window(self, bit_count: int):
+        """
+        Take the next bit_count bits off as a reader of their own
+        """
+        return HexBinaryThingy(self.get_bits(bit_count))
+
+
+class BitReader:
+    """
+    Same job as HexBinaryThingy but the bits stay packed in the bytes they
+    arrived in. Reads pull out just the bytes covering the bits wanted and
+    shift / mask them, and child readers share the same bytes.
+    """
+
+    def __init__(self, data: bytes, start: int = 0, end: Optional[int] = None) -> None:
+        self.data = memoryview(data)
+        self.idx = start
+        self.end = len(data) * 8 if end is None else end
+
+    def from_hex(hex: str):
+        """
+        Create a reader for a string of hex digits
+        """
+        hex = hex.strip()
+        bit_count = len(hex) * 4
+        if len(hex) % 2:
+            # bytes.fromhex needs whole bytes, the extra nibble is never read
+            hex += "0"
+        return BitReader(bytes.fromhex(hex), 0, bit_count)
+
+    def __repr__(self) -> str:
+        remaining = self.bits_remaining()
+        return f"BitReader<idx={self.idx}, end={self.end}, remaining_bits={remaining}>"
+
+    def read(self, bit_count: int) -> int:
+        """
+        Read the next bit_count bits and return the int value
+        """
+        start = self.idx
+        end = start + bit_count
+        if end > self.end:
+            raise ValueError("You're out of bits mofo!")
+        first_byte = start >> 3
+        last_byte = (end + 7) >> 3
+        chunk = int.from_bytes(self.data[first_byte:last_byte], "big")
+        self.idx = end
+        return (chunk >> ((last_byte << 3) - end)) & ((1 << bit_count) - 1)
+
+    def get_int(self, bit_count: int) -> int:
+        return self.read(bit_count)
+
+    def get_next_bit(self):
+        return self.read(1)
+
+    def bits_remaining(self):
+        return self.end - self.idx
+
+    def window(self, bit_count: int):
+        """
+        Take the next bit_count bits off as a reader of their own, sharing
+        our bytes rather than copying them
+        """
+        if self.idx + bit_count > self.end:
+            raise ValueError("You're out of bits mofo!")
+        result = BitReader(self.data, self.idx, self.idx + bit_count)
+        self.idx += bit_count
+        return result
+
 
 # Packets with type ID 0 are sum packets - their value is the sum of the values of their sub-packets. If they only have a single sub-packet, their value is the value of the sub-packet.
 # Packets with type ID 1 are product packets - their value is the result of multiplying together the values of their sub-packets. If they only have a single sub-packet, their value is the value of the sub-packet.
@@ -339,13 +410,268 @@ class Packet:
                 packet_length = bits.get_int(15)
                 print(f"Packet Length is {packet_length}")
                 # get the child bits..
-                child_bit_values = bits.get_bits(packet_length)
-                child_bits = HexBinaryThingy(child_bit_values)
+                child_bits = bits.window(packet_length)
                 while child_bits.bits_remaining():
                     this_child_packet = Packet(child_bits, self.depth + 1)
                     self.child_packets.append(this_child_packet)
 
 
+# Flat postfix form of a transmission, 4 ints per packet with the children
+# always before their parent:
+#    version, type, value (literal packets only, 0 otherwise), child count
+POSTFIX_STRIDE = 4
+
+
+def product(values):
+    result = 1
+    for x in values:
+        result *= x
+    return result
+
+
+POSTFIX_OPERATORS = {
+    Packet.TYPE_SUM: sum,
+    Packet.TYPE_PRODUCT: product,
+    Packet.TYPE_MIN: min,
+    Packet.TYPE_MAX: max,
+    Packet.TYPE_GT: lambda values: 1 if values[0] > values[1] else 0,
+    Packet.TYPE_LT: lambda values: 1 if values[0] < values[1] else 0,
+    Packet.TYPE_EQUAL: lambda values: 1 if values[0] == values[1] else 0,
+}
+
+
+def read_literal(bits) -> int:
+    """
+    Read the 5-bit groups of a literal packet's value
+    """
+    the_value = 0
+    continuation = 1
+    while continuation:
+        continuation = bits.get_next_bit()
+        the_value = (the_value << 4) | bits.get_int(4)
+    return the_value
+
+
+def check_child_count(packet_type: int, child_count: int):
+    """
+    The comparison operators only make sense with exactly two sub-packets
+    """
+    if packet_type in (Packet.TYPE_GT, Packet.TYPE_LT, Packet.TYPE_EQUAL):
+        if 2 != child_count:
+            raise ValueError(
+                f"Operator {packet_type} needs 2 sub-packets, not {child_count}"
+            )
+
+
+def operator_finished(by_count: int, limit: int, child_count: int, bits) -> bool:
+    """
+    Has an operator got all its sub-packets yet ? limit is either the number
+    of sub-packets or the bit index where they end, depending on by_count.
+    A sub-packet that runs past the end of its parent's bits is an error.
+    """
+    if by_count:
+        return child_count == limit
+    if bits.idx > limit:
+        raise ValueError(
+            f"Sub-packet ran {bits.idx - limit} bits past the end of its parent"
+        )
+    return bits.idx == limit
+
+
+def decode_postfix(bits) -> List[int]:
+    """
+    Decode a single (outer) packet from bits into the flat postfix form.
+
+    No recursion, the operator packets still waiting for children are kept
+    on a stack of [version, type, by_count, count or end bit, children so far]
+    and when a packet finishes it is credited to the operator on top, which
+    might finish that one too, and so on.
+    """
+    result = []
+    stack = []
+    while True:
+        version = bits.get_int(3)
+        packet_type = bits.get_int(3)
+        if Packet.TYPE_LITERAL == packet_type:
+            result.extend((version, packet_type, read_literal(bits), 0))
+        else:
+            if packet_type not in POSTFIX_OPERATORS:
+                raise ValueError(f"What the hell is a {packet_type} operator ???")
+            by_count = bits.get_next_bit()
+            if by_count:
+                limit = bits.get_int(11)
+            else:
+                limit = bits.get_int(15) + bits.idx
+            if (by_count and 0 != limit) or (not by_count and bits.idx < limit):
+                # need to go and get the children first
+                stack.append([version, packet_type, by_count, limit, 0])
+                continue
+            # an operator with no children, odd but complete for some
+            if packet_type not in (Packet.TYPE_SUM, Packet.TYPE_PRODUCT):
+                raise ValueError(f"Operator {packet_type} has no sub-packets")
+            result.extend((version, packet_type, 0, 0))
+
+        # a packet has finished, see which operators that finishes
+        while stack:
+            frame = stack[-1]
+            frame[4] += 1
+            if not operator_finished(frame[2], frame[3], frame[4], bits):
+                break
+            stack.pop()
+            check_child_count(frame[1], frame[4])
+            result.extend((frame[0], frame[1], 0, frame[4]))
+
+        if not stack:
+            return result
+
+
+def evaluate_postfix(postfix: List[int]) -> int:
+    """
+    Work out the value of a postfix transmission in a single pass, each
+    operator takes its children's values off the end of the value stack
+    """
+    values = []
+    for idx in range(0, len(postfix), POSTFIX_STRIDE):
+        packet_type = postfix[idx + 1]
+        if Packet.TYPE_LITERAL == packet_type:
+            values.append(postfix[idx + 2])
+            continue
+        if packet_type not in POSTFIX_OPERATORS:
+            raise ValueError(f"What the hell is a {packet_type} operator ???")
+        child_count = postfix[idx + 3]
+        children = values[len(values) - child_count :]
+        del values[len(values) - child_count :]
+        values.append(POSTFIX_OPERATORS[packet_type](children))
+    return values[0]
+
+
+def sum_postfix_versions(postfix: List[int]) -> int:
+    return sum(postfix[0::POSTFIX_STRIDE])
+
+
+def fold_child(packet_type: int, total, child_number: int, value: int):
+    """
+    Fold a child's value into an operator's running total, child_number
+    counting from 0. Returns the new running total
+    """
+    if 0 == child_number:
+        return value
+    if Packet.TYPE_SUM == packet_type:
+        return total + value
+    if Packet.TYPE_PRODUCT == packet_type:
+        return total * value
+    if Packet.TYPE_MIN == packet_type:
+        return min(total, value)
+    if Packet.TYPE_MAX == packet_type:
+        return max(total, value)
+    if Packet.TYPE_GT == packet_type:
+        return 1 if total > value else 0
+    if Packet.TYPE_LT == packet_type:
+        return 1 if total < value else 0
+    if Packet.TYPE_EQUAL == packet_type:
+        return 1 if total == value else 0
+    raise ValueError(f"What the hell is a {packet_type} operator ???")
+
+
+def stream_evaluate(bits) -> Tuple[int, int]:
+    """
+    Return (version sum, value) for a single (outer) packet without keeping
+    any of the packets around.
+
+    Like decode_postfix the waiting operators are on a stack, as
+    [type, by_count, count or end bit, children so far, running total], and
+    each finished packet's value gets folded straight into the one on top, so
+    the memory needed only depends on how deep the packets go.
+    """
+    version_sum = 0
+    stack = []
+    while True:
+        version_sum += bits.get_int(3)
+        packet_type = bits.get_int(3)
+        if Packet.TYPE_LITERAL == packet_type:
+            value = read_literal(bits)
+        else:
+            if packet_type not in POSTFIX_OPERATORS:
+                raise ValueError(f"What the hell is a {packet_type} operator ???")
+            by_count = bits.get_next_bit()
+            if by_count:
+                limit = bits.get_int(11)
+            else:
+                limit = bits.get_int(15) + bits.idx
+            if (by_count and 0 != limit) or (not by_count and bits.idx < limit):
+                # need to go and get the children first
+                stack.append([packet_type, by_count, limit, 0, None])
+                continue
+            # an operator with no children, odd but complete
+            if Packet.TYPE_SUM == packet_type:
+                value = 0
+            elif Packet.TYPE_PRODUCT == packet_type:
+                value = 1
+            else:
+                raise ValueError(f"Operator {packet_type} has no sub-packets")
+
+        # a packet has finished, fold it into the operators above
+        while stack:
+            frame = stack[-1]
+            frame[4] = fold_child(frame[0], frame[4], frame[3], value)
+            frame[3] += 1
+            if not operator_finished(frame[1], frame[2], frame[3], bits):
+                break
+            stack.pop()
+            check_child_count(frame[0], frame[3])
+            value = frame[4]
+
+        if not stack:
+            return version_sum, value
+
+
+def decode_transmission(hex: str) -> Tuple[int, int]:
+    """
+    Return (version sum, value) for one transmission of hex digits
+    """
+    return stream_evaluate(BitReader.from_hex(hex))
+
+
+def batch_decode(
+    filename: str, workers: Optional[int] = None
+) -> Iterator[Tuple[int, int, int]]:
+    """
+    Decode a file with one transmission per line, spreading the lines over a
+    process pool. Yields (line number, version sum, value) in file order.
+    Only a limited number of lines are in flight at once so the file is
+    streamed rather than read up front. A line that won't decode raises
+    ValueError naming that line.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    in_flight_limit = workers * 16
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        with open(filename, "r") as f:
+            for line_no, this_line in enumerate(f, start=1):
+                this_line = this_line.strip()
+                if "" == this_line:
+                    continue
+                future = executor.submit(decode_transmission, this_line)
+                in_flight.append((line_no, future))
+                if len(in_flight) >= in_flight_limit:
+                    yield batch_result(filename, *in_flight.popleft())
+        while in_flight:
+            yield batch_result(filename, *in_flight.popleft())
+
+
+def batch_result(filename: str, line_no: int, future) -> Tuple[int, int, int]:
+    """
+    (line number, version sum, value) from a finished batch_decode() line,
+    any decoding error is raised again saying which line it came from
+    """
+    try:
+        version_sum, value = future.result()
+    except ValueError as e:
+        raise ValueError(f"{filename} line {line_no}: {e}") from e
+    return line_no, version_sum, value
+
+
 def part1(filename: str) -> int:
     """
     Run the part1 logic
@@ -359,16 +685,14 @@ def part1(filename: str) -> int:
                 hex_digits += this_line
 
     # load them into the binary provider thingy..
-    binary = HexBinaryThingy()
-    binary.load_hex_digits(hex_digits)
+    binary = BitReader.from_hex(hex_digits)
     print(binary)
 
-    # Create the Packet Parser with these bits..
-    container = Packet(binary)
-    print(container)
+    # Run through the packets with these bits..
+    version_sum, _ = stream_evaluate(binary)
 
     # return the thingy count thingy TBD
-    return container.sum_versions()
+    return version_sum
 
 
 def part2(filename: str) -> int:
@@ -384,12 +708,10 @@ def part2(filename: str) -> int:
                 hex_digits += this_line
 
     # load them into the binary provider thingy..
-    binary = HexBinaryThingy()
-    binary.load_hex_digits(hex_digits)
+    binary = BitReader.from_hex(hex_digits)
 
-    # Create the Packet Parser with these bits..
-    container = Packet(binary)
-    result = container.evaluate()
+    # Run through the packets with these bits..
+    _, result = stream_evaluate(binary)
 
     # return the thingy count thingy TBD
     return result
@@ -465,6 +787,23 @@ def sanity_check():
         actual = container.evaluate()
         print(f"Input {hex}, got {actual}, expected {expected}")
         assert actual == expected
+        # and the same again through the flat postfix decoder
+        postfix = decode_postfix(BitReader.from_hex(hex))
+        assert evaluate_postfix(postfix) == expected
+        assert sum_postfix_versions(postfix) == container.sum_versions()
+        # and streamed without keeping any packets
+        streamed = stream_evaluate(BitReader.from_hex(hex))
+        assert streamed == (container.sum_versions(), expected)
+
+    # a sum whose 5 bits of sub-packets hold an 11 bit literal
+    overrun = bin_to_hex("001" + "000" + "0" + "000000000000101" + "00110000101000")
+    for decoder in (decode_postfix, stream_evaluate):
+        try:
+            decoder(BitReader.from_hex(overrun))
+        except ValueError as e:
+            print(f"Input {overrun}, {decoder.__name__} rejected it: {e}")
+        else:
+            assert False, f"{decoder.__name__} should have rejected {overrun}"
 
 
 if __name__ == "__main__":
@@ -172,7 +172,8 @@
 # Add up all of the snailfish numbers from the homework assignment in the order they appear. What is the magnitude of the final sum?
 
 
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional, Tuple
 
 
 class SnailfishNumber:
@@ -346,12 +347,17 @@ class SnailfishNumber:
         # and we're done..
         return result
 
-    def add_list(numbers: List[str]) -> object:
+    def add_list(numbers: Iterable[str]) -> object:
         """
         Add all the strings as SnailfishNumbers and return the answer
+        numbers can be any iterable of lines, such as an open file, blank lines
+        are skipped
         """
         answer = None
         for this_number_str in numbers:
+            this_number_str = this_number_str.strip()
+            if "" == this_number_str:
+                continue
             this_number = SnailfishNumber.parse(this_number_str)
             if answer is None:
                 answer = this_number
@@ -362,51 +368,380 @@ class SnailfishNumber:
     def parse(s: str) -> object:
         """
         Parse an input string and return the SnailfishNumber result
+        One pass through the string, each [ starts a new list of children
+        on the stack, each , must sit between the two children and each ]
+        turns the top two children into a pair.
+        Raises ValueError for anything that isn't exactly a snailfish number
+        """
+        # each entry is [children, has the comma been seen]
+        stack = [[[], False]]
+        value = None
+
+        def add_child(child: SnailfishNumber):
+            children, seen_comma = stack[-1]
+            # the first child comes before the comma, the second after it
+            if len(children) != (1 if seen_comma else 0):
+                raise ValueError(f"Not a valid snailfish number: {s}")
+            children.append(child)
+
+        for this_char in s:
+            if this_char in "0123456789":
+                value = (value or 0) * 10 + int(this_char)
+                continue
+            if value is not None:
+                regular = SnailfishNumber()
+                regular.set_value(value)
+                add_child(regular)
+                value = None
+            if "[" == this_char:
+                stack.append([[], False])
+            elif "," == this_char:
+                children, seen_comma = stack[-1]
+                if 1 == len(stack) or seen_comma or 1 != len(children):
+                    raise ValueError(f"Not a valid snailfish number: {s}")
+                stack[-1][1] = True
+            elif "]" == this_char:
+                children, _ = stack.pop()
+                if 2 != len(children) or not stack:
+                    raise ValueError(f"Not a valid snailfish number: {s}")
+                pair = SnailfishNumber()
+                pair.set_pair(*children)
+                add_child(pair)
+            else:
+                raise ValueError(f"Not a valid snailfish number: {s}")
+        if value is not None:
+            regular = SnailfishNumber()
+            regular.set_value(value)
+            add_child(regular)
+
+        if 1 != len(stack) or 1 != len(stack[0][0]):
+            raise ValueError(f"Not a valid snailfish number: {s}")
+        return stack[0][0][0]
+
+
+class FlatSnailfishNumber:
+    """
+    The same numbers as SnailfishNumber but held as two lists, the regular
+    numbers from left to right and how many pairs each one is nested inside.
+    [[1,2],3] is values [1, 2, 3] with depths [2, 2, 1]
+
+    The numbers either side of an exploding pair are just the list
+    neighbours, so there's no walking around a tree to find them.
+    """
+
+    def __init__(
+        self, values: Optional[List[int]] = None, depths: Optional[List[int]] = None
+    ) -> None:
+        self.values = values if values is not None else []
+        self.depths = depths if depths is not None else []
+
+    def copy(self) -> object:
+        return FlatSnailfishNumber(list(self.values), list(self.depths))
+
+    def fold(self, regular, pair):
+        """
+        Rebuild the tree shape bottom up, regular(value) makes a leaf and
+        pair(left, right) joins two neighbouring parts at the same depth
+        """
+        stack = []
+        for value, depth in zip(self.values, self.depths):
+            this_part = regular(value)
+            # join up with anything waiting on the left at the same depth
+            while stack and stack[-1][1] == depth:
+                left_part, _ = stack.pop()
+                this_part = pair(left_part, this_part)
+                depth -= 1
+            stack.append((this_part, depth))
+        if 1 != len(stack):
+            raise ValueError(f"Not a valid snailfish number: {stack}")
+        return stack[0][0]
+
+    def __repr__(self) -> str:
+        return self.fold(str, lambda left, right: f"[{left},{right}]")
+
+    def magnitude(self):
+        """
+        For a pair, 3*left+2*right,
+        For a number, the number
+        """
+        return self.fold(lambda value: value, lambda left, right: 3 * left + 2 * right)
+
+    def to_tree(self) -> SnailfishNumber:
+        """
+        Convert back into a SnailfishNumber
         """
-        if s[0] == "[":
-            # find the mid-way comma
-            bracket_count = 0
-            for comma_position, this_char in enumerate(s[1:]):
-                if "," == this_char and 0 == bracket_count:
-                    # we're done, this is the one..
-                    break
-                elif "[" == this_char:
-                    bracket_count += 1
-                elif "]" == this_char:
-                    bracket_count -= 1
-
-            # the comma position is 1 indexed, need to adjust
-            comma_position += 1
-
-            # got a comma, split up the remainder of the string
-            lhs = s[1:comma_position]
-            rhs = s[comma_position + 1 : -1]
+
+        def regular(value: int) -> SnailfishNumber:
             result = SnailfishNumber()
-            left = SnailfishNumber.parse(lhs)
-            right = SnailfishNumber.parse(rhs)
-            result.set_pair(left, right)
-        else:
+            result.set_value(value)
+            return result
+
+        def pair(left: SnailfishNumber, right: SnailfishNumber) -> SnailfishNumber:
             result = SnailfishNumber()
-            result.set_value(int(s))
+            result.set_pair(left, right)
+            return result
+
+        return self.fold(regular, pair)
+
+    def from_tree(number: SnailfishNumber) -> object:
+        """
+        Convert a SnailfishNumber, left to right
+        """
+        result = FlatSnailfishNumber()
+        regulars = []
+        number.list_numbers(regulars)
+        for node in regulars:
+            result.values.append(node.value)
+            result.depths.append(node.parent_count())
+        return result
+
+    def parse(s: str) -> object:
+        """
+        Parse an input string and return the FlatSnailfishNumber result
+        Checked the same way as SnailfishNumber.parse(), anything that isn't
+        exactly a snailfish number raises ValueError
+        """
+        result = FlatSnailfishNumber()
+        # for each open pair, [children so far, has the comma been seen]
+        stack = [[0, False]]
+        value = None
+
+        def add_child():
+            children, seen_comma = stack[-1]
+            if children != (1 if seen_comma else 0):
+                raise ValueError(f"Not a valid snailfish number: {s}")
+            stack[-1][0] += 1
+
+        for this_char in s:
+            if this_char in "0123456789":
+                value = (value or 0) * 10 + int(this_char)
+                continue
+            if value is not None:
+                add_child()
+                result.values.append(value)
+                result.depths.append(len(stack) - 1)
+                value = None
+            if "[" == this_char:
+                stack.append([0, False])
+            elif "," == this_char:
+                children, seen_comma = stack[-1]
+                if 1 == len(stack) or seen_comma or 1 != children:
+                    raise ValueError(f"Not a valid snailfish number: {s}")
+                stack[-1][1] = True
+            elif "]" == this_char:
+                children, _ = stack.pop()
+                if 2 != children or not stack:
+                    raise ValueError(f"Not a valid snailfish number: {s}")
+                add_child()
+            else:
+                raise ValueError(f"Not a valid snailfish number: {s}")
+        if value is not None:
+            add_child()
+            result.values.append(value)
+            result.depths.append(len(stack) - 1)
+
+        if 1 != len(stack) or 1 != stack[0][0]:
+            raise ValueError(f"Not a valid snailfish number: {s}")
+        return result
+
+    def explode_at(self, index: int):
+        """
+        Explode the pair whose left number is at index
+        """
+        values = self.values
+        depths = self.depths
+        if index + 1 >= len(values) or depths[index + 1] != depths[index]:
+            raise RuntimeError(f"Trying to explode a non-simple pair in {self}")
+        if index > 0:
+            values[index - 1] += values[index]
+        if index + 2 < len(values):
+            values[index + 2] += values[index + 1]
+        # the pair turns into a 0 one level up
+        values[index] = 0
+        depths[index] -= 1
+        del values[index + 1]
+        del depths[index + 1]
+
+    def split_at(self, index: int):
+        """
+        Split the number at index into a pair, leftovers go on the right
+        """
+        value = self.values[index]
+        left_value = value // 2
+        depth = self.depths[index] + 1
+        self.values[index : index + 1] = [left_value, value - left_value]
+        self.depths[index : index + 1] = [depth, depth]
+
+    def explode(self) -> bool:
+        """
+        Explode the left-most pair nested inside 4 pairs, if there is one
+        """
+        for index, depth in enumerate(self.depths):
+            if depth > 4:
+                self.explode_at(index)
+                return True
+        return False
+
+    def split(self) -> bool:
+        """
+        Split the left-most number that's more than 9, if there is one
+        """
+        for index, value in enumerate(self.values):
+            if value > 9:
+                self.split_at(index)
+                return True
+        return False
+
+    def reduce(self):
+        """
+        Same rules as SnailfishNumber.reduce, in two scans.
+
+        Exploding never makes anything deeper, so first every deep pair can go
+        from left to right. After that only a split at depth 4 makes a deep
+        pair, and it is the only one so it explodes straight away, which might
+        push the number to its left over 9 so we step back one.
+        """
+        values = self.values
+        depths = self.depths
+
+        index = 0
+        while index < len(values):
+            if depths[index] > 4:
+                self.explode_at(index)
+            index += 1
+
+        index = 0
+        while index < len(values):
+            if values[index] <= 9:
+                index += 1
+            elif depths[index] >= 4:
+                self.split_at(index)
+                self.explode_at(index)
+                index = max(index - 1, 0)
+            else:
+                # the left half might still need splitting
+                self.split_at(index)
+
+    def add(number1: object, number2: object) -> object:
+        """
+        Return the result of an addition, the inputs are left alone
+        """
+        result = FlatSnailfishNumber(
+            number1.values + number2.values,
+            [d + 1 for d in number1.depths] + [d + 1 for d in number2.depths],
+        )
+        result.reduce()
         return result
 
+    def add_list(numbers: Iterable[str]) -> object:
+        """
+        Add all the strings as FlatSnailfishNumbers and return the answer
+        numbers can be any iterable of lines, such as an open file, blank lines
+        are skipped
+        """
+        answer = None
+        for this_number_str in numbers:
+            this_number_str = this_number_str.strip()
+            if "" == this_number_str:
+                continue
+            this_number = FlatSnailfishNumber.parse(this_number_str)
+            if answer is None:
+                answer = this_number
+            else:
+                answer = FlatSnailfishNumber.add(answer, this_number)
+        return answer
+
+    def best_pair(numbers: List[str], workers: int = 0) -> Tuple[int, int, int]:
+        """
+        Find the largest magnitude from adding any two different numbers in the
+        list, returns (magnitude, left index, right index).
+        Each number is only parsed once, with workers set the left hand numbers
+        are shared out between that many processes.
+        """
+        parsed = [FlatSnailfishNumber.parse(n) for n in numbers]
+        compact = [(tuple(n.values), tuple(n.depths)) for n in parsed]
+        if workers <= 0:
+            return best_pair_for(compact, range(len(compact)))
+
+        # interleave the left hand indexes so each chunk gets a fair mix
+        chunk_count = workers * 4
+        chunks = [
+            range(start, len(compact), chunk_count) for start in range(chunk_count)
+        ]
+        # the numbers go to each worker once, rather than with every chunk
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=share_numbers, initargs=(compact,)
+        ) as executor:
+            results = executor.map(best_pair_for_shared, chunks)
+            return max(results, key=pair_preference)
+
+
+def best_pair_for(
+    numbers: List[Tuple[Tuple[int, ...], Tuple[int, ...]]], left_indexes: Iterable[int]
+) -> Tuple[int, int, int]:
+    """
+    Try every left hand index against all the other numbers, returning the best
+    (magnitude, left index, right index). Module level so that worker processes
+    can run it.
+    """
+    best = (-1, -1, -1)
+    for left_index in left_indexes:
+        left_values, left_depths = numbers[left_index]
+        left_depths = [d + 1 for d in left_depths]
+        for right_index, (right_values, right_depths) in enumerate(numbers):
+            if left_index == right_index:
+                continue
+            total = FlatSnailfishNumber(
+                list(left_values) + list(right_values),
+                left_depths + [d + 1 for d in right_depths],
+            )
+            total.reduce()
+            this_magnitude = total.magnitude()
+            this_pair = (this_magnitude, left_index, right_index)
+            if pair_preference(this_pair) > pair_preference(best):
+                best = this_pair
+    return best
+
+
+def pair_preference(result: Tuple[int, int, int]) -> Tuple[int, int, int]:
+    """
+    How to pick between (magnitude, left index, right index) results, the
+    biggest magnitude wins and a tie goes to the lowest indexes, so the answer
+    doesn't depend on how the work was split up
+    """
+    magnitude, left_index, right_index = result
+    return magnitude, -left_index, -right_index
+
+
+# the numbers a worker process was handed by share_numbers()
+shared_numbers = []
+
+
+def share_numbers(numbers: List[Tuple[Tuple[int, ...], Tuple[int, ...]]]):
+    """
+    Process pool initializer, keeps the numbers for best_pair_for_shared()
+    """
+    global shared_numbers
+    shared_numbers = numbers
+
+
+def best_pair_for_shared(left_indexes: Iterable[int]) -> Tuple[int, int, int]:
+    """
+    best_pair_for() against the numbers this worker was given
+    """
+    return best_pair_for(shared_numbers, left_indexes)
+
 
 def part1(filename: str):
     """
     Add up all the numbers in the file and return the magnitude
     """
-    number_list = []
     with open(filename, "r") as f:
-        for this_line in f:
-            this_line = this_line.strip()
-            if "" != this_line:
-                number_list.append(this_line)
-
-    total = SnailfishNumber.add_list(number_list)
+        total = FlatSnailfishNumber.add_list(f)
     return total.magnitude()
 
 
-def part2(filename: str):
+def part2(filename: str, workers: int = 0):
     """
     Find the largest magnitude for any single pair addition in the list provided.
     """
@@ -417,18 +752,8 @@ def part2(filename: str):
             if "" != this_line:
                 number_list.append(this_line)
 
-    best_magnitude = -99999
-    for a in number_list:
-        for b in number_list:
-            if a != b:
-                # if there are duplicates, and they are the best answer, then we'll be back here swearing later on..
-                ax = SnailfishNumber.parse(a)
-                bx = SnailfishNumber.parse(b)
-                cx = SnailfishNumber.add(ax, bx)
-                this_magnitude = cx.magnitude()
-                if this_magnitude > best_magnitude:
-                    best_magnitude = this_magnitude
-                    print(f"Best so far: {best_magnitude}: {a} + {b} = {cx}")
+    best_magnitude, a, b = FlatSnailfishNumber.best_pair(number_list, workers)
+    print(f"Best: {best_magnitude}: {number_list[a]} + {number_list[b]}")
     return best_magnitude
 
 
@@ -1,6 +1,6 @@
 import pytest
 
-from day18 import SnailfishNumber
+from day18 import FlatSnailfishNumber, SnailfishNumber
 
 
 @pytest.mark.parametrize(
@@ -231,3 +231,168 @@ def test_homework_exercise():
     the_result = SnailfishNumber.add_list(numbers_to_add)
     assert str(the_result) == expected_number
     assert the_result.magnitude() == expected_magnitude
+
+
+@pytest.mark.parametrize(
+    "input_number",
+    [
+        ("9"),
+        ("[1,2]"),
+        ("[[1,2],3]"),
+        ("[9,[8,7]]"),
+        ("[[[[1,2],[3,4]],[[5,6],[7,8]]],9]"),
+        ("[[[[1,3],[5,3]],[[1,3],[8,7]]],[[[4,9],[6,9]],[[8,2],[7,3]]]]"),
+    ],
+)
+def test_flat_parse(input_number):
+    """
+    The flat form should parse and represent itself the same way, and convert
+    to and from the tree form
+    """
+    actual = FlatSnailfishNumber.parse(input_number)
+    assert str(actual) == input_number
+    assert str(actual.to_tree()) == input_number
+    tree = SnailfishNumber.parse(input_number)
+    assert str(FlatSnailfishNumber.from_tree(tree)) == input_number
+
+
+@pytest.mark.parametrize(
+    "input_number,expected_result,expected_number",
+    [
+        ("[[[[[9,8],1],2],3],4]", True, "[[[[0,9],2],3],4]"),
+        ("[7,[6,[5,[4,[3,2]]]]]", True, "[7,[6,[5,[7,0]]]]"),
+        ("[[6,[5,[4,[3,2]]]],1]", True, "[[6,[5,[7,0]]],3]"),
+        ("[[1,2],[3,4]]", False, "[[1,2],[3,4]]"),
+    ],
+)
+def test_flat_explode(input_number, expected_result, expected_number):
+    numb = FlatSnailfishNumber.parse(input_number)
+    actual = numb.explode()
+    assert actual == expected_result
+    assert expected_number == str(numb)
+
+
+@pytest.mark.parametrize(
+    "input_number,expected_result,expected_number",
+    [
+        ("[9,9]", False, "[9,9]"),
+        ("[11,1]", True, "[[5,6],1]"),
+        ("[16,14]", True, "[[8,8],14]"),
+    ],
+)
+def test_flat_split(input_number, expected_result, expected_number):
+    numb = FlatSnailfishNumber.parse(input_number)
+    actual = numb.split()
+    assert actual == expected_result
+    assert expected_number == str(numb)
+
+
+@pytest.mark.parametrize(
+    "number1,number2,expected_number",
+    [
+        ("[[[[4,3],4],4],[7,[[8,4],9]]]", "[1,1]", "[[[[0,7],4],[[7,8],[6,0]]],[8,1]]"),
+        (
+            "[[[0,[4,5]],[0,0]],[[[4,5],[2,6]],[9,5]]]",
+            "[7,[[[3,7],[4,3]],[[6,3],[8,8]]]]",
+            "[[[[4,0],[5,4]],[[7,7],[6,0]]],[[8,[7,7]],[[7,9],[5,0]]]]",
+        ),
+        (
+            "[[[[6,6],[6,6]],[[6,0],[6,7]]],[[[7,7],[8,9]],[8,[8,1]]]]",
+            "[2,9]",
+            "[[[[6,6],[7,7]],[[0,7],[7,7]]],[[[5,5],[5,6]],9]]",
+        ),
+    ],
+)
+def test_flat_addition(number1, number2, expected_number):
+    """
+    Adding should match the tree version and leave the inputs alone
+    """
+    a = FlatSnailfishNumber.parse(number1)
+    b = FlatSnailfishNumber.parse(number2)
+    actual = FlatSnailfishNumber.add(a, b)
+    assert str(actual) == expected_number
+    assert str(a) == number1
+    assert str(b) == number2
+
+
+def test_flat_homework_exercise():
+    """
+    The same straight-through example using the flat form
+    """
+    numbers_to_add = [
+        "[[[0,[5,8]],[[1,7],[9,6]]],[[4,[1,2]],[[1,4],2]]]",
+        "[[[5,[2,8]],4],[5,[[9,9],0]]]",
+        "[6,[[[6,2],[5,6]],[[7,6],[4,7]]]]",
+        "[[[6,[0,7]],[0,9]],[4,[9,[9,0]]]]",
+        "[[[7,[6,4]],[3,[1,3]]],[[[5,5],1],9]]",
+        "[[6,[[7,3],[3,2]]],[[[3,8],[5,7]],4]]",
+        "[[[[5,4],[7,7]],8],[[8,3],8]]",
+        "[[9,3],[[9,9],[6,[4,9]]]]",
+        "[[2,[[7,7],7]],[[5,8],[[9,3],[0,2]]]]",
+        "[[[[5,2],5],[8,[3,7]]],[[5,[7,5]],[4,4]]]",
+    ]
+    expected_number = "[[[[6,6],[7,6]],[[7,7],[7,0]]],[[[7,7],[7,7]],[[7,8],[9,9]]]]"
+    expected_magnitude = 4140
+
+    the_result = FlatSnailfishNumber.add_list(numbers_to_add)
+    assert str(the_result) == expected_number
+    assert the_result.magnitude() == expected_magnitude
+
+
+def test_flat_best_pair():
+    """
+    The part 2 example, best pair is the 9th + 1st giving 3993
+    """
+    numbers = [
+        "[[[0,[5,8]],[[1,7],[9,6]]],[[4,[1,2]],[[1,4],2]]]",
+        "[[[5,[2,8]],4],[5,[[9,9],0]]]",
+        "[6,[[[6,2],[5,6]],[[7,6],[4,7]]]]",
+        "[[[6,[0,7]],[0,9]],[4,[9,[9,0]]]]",
+        "[[[7,[6,4]],[3,[1,3]]],[[[5,5],1],9]]",
+        "[[6,[[7,3],[3,2]]],[[[3,8],[5,7]],4]]",
+        "[[[[5,4],[7,7]],8],[[8,3],8]]",
+        "[[9,3],[[9,9],[6,[4,9]]]]",
+        "[[2,[[7,7],7]],[[5,8],[[9,3],[0,2]]]]",
+        "[[[[5,2],5],[8,[3,7]]],[[5,[7,5]],[4,4]]]",
+    ]
+    assert FlatSnailfishNumber.best_pair(numbers) == (3993, 8, 0)
+
+
+@pytest.mark.parametrize("workers", [0, 2, 3])
+def test_flat_best_pair_ties(workers):
+    """
+    Ties go to the lowest indexes however the work is split
+    """
+    numbers = ["[1,1]", "[9,9]", "[9,9]", "[2,2]"]
+    assert FlatSnailfishNumber.best_pair(numbers, workers) == (225, 1, 2)
+
+
+@pytest.mark.parametrize(
+    "input_number",
+    [
+        ("[1,2"),
+        ("[1,2]]"),
+        ("[1,2,3]"),
+        ("[[1],2]"),
+        ("[1;2]"),
+        ("[1 2]"),
+        ("[1,,2]"),
+        ("[[1,2],3]xyz"),
+    ],
+)
+def test_snailfish_parse_bad(input_number):
+    with pytest.raises(ValueError):
+        SnailfishNumber.parse(input_number)
+    with pytest.raises(ValueError):
+        FlatSnailfishNumber.parse(input_number)
+
+
+def test_add_list_from_file(tmpdir):
+    """
+    add_list should take the lines straight from a file
+    """
+    f = tmpdir.join("numbers.txt")
+    f.write("[1,1]\n[2,2]\n\n[3,3]\n[4,4]\n")
+    with open(str(f), "r") as lines:
+        actual = SnailfishNumber.add_list(lines)
+    assert str(actual) == "[[[[1,1],[2,2]],[3,3]],[4,4]]"
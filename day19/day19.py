@@ -403,6 +403,60 @@
 #
 
 
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+# how many beacons two scanners must have in common to be aligned
+OVERLAP_NEEDED = 12
+
+# beacon coordinates are packed into a single int, 21 bits per axis
+PACK_BITS = 21
+PACK_OFFSET = 1 << (PACK_BITS - 1)
+
+
+def pack_point(x: int, y: int, z: int) -> int:
+    """
+    Squash a point into one int, each axis must be within +/- 2**20
+    """
+    for value in (x, y, z):
+        if not -PACK_OFFSET <= value < PACK_OFFSET:
+            raise ValueError(f"({x},{y},{z}) is too far out to pack")
+    return (
+        ((x + PACK_OFFSET) << (2 * PACK_BITS))
+        | ((y + PACK_OFFSET) << PACK_BITS)
+        | (z + PACK_OFFSET)
+    )
+
+
+def proper_rotations() -> List[Tuple[int, int, int, bool, bool, bool]]:
+    """
+    All the ways a scanner can be facing, as (x, y, z, x_flip, y_flip, z_flip)
+    where the first three say which of the original axes becomes x, y and z.
+
+    Of the 48 axis orders and flips, half are mirror images rather than
+    rotations, those are the ones where the axis order is odd and an even
+    number of axes are flipped or the other way around.
+    """
+    result = list()
+    for x in range(3):
+        for y in range(3):
+            for z in range(3):
+                if x != y and x != z and y != z:
+                    # got a good xyz set..
+                    odd_order = (x, y, z) in [(0, 2, 1), (1, 0, 2), (2, 1, 0)]
+                    for x_flip in (False, True):
+                        for y_flip in (False, True):
+                            for z_flip in (False, True):
+                                odd_flips = (x_flip + y_flip + z_flip) % 2 == 1
+                                if odd_order == odd_flips:
+                                    result.append((x, y, z, x_flip, y_flip, z_flip))
+    return result
+
+
+ROTATIONS = proper_rotations()
+
+
 def manhattan(a, b):
     small = min(a, b)
     big = max(a, b)
@@ -417,20 +471,10 @@ class Scanner:
         self.z = None
         self.scanner_number = scanner_number
         self.config_idx = 0
-        self.configurations = list()
-
-        for x in range(3):
-            for y in range(3):
-                for z in range(3):
-                    if x != y and x != z and y != z:
-                        # got a good xyz set..
-                        for x_flip in (False, True):
-                            for y_flip in (False, True):
-                                for z_flip in (False, True):
-                                    # these aren't exclusive
-                                    self.configurations.append(
-                                        (x, y, z, x_flip, y_flip, z_flip)
-                                    )
+        self.configurations = ROTATIONS
+        self.fingerprint = None
+        self.distance_counts = None
+        self.rotated_points = None
 
     def __str__(self) -> str:
         result = f"Scanner {self.scanner_number} ({len(self.points)} points, "
@@ -449,6 +493,75 @@ class Scanner:
 
     def add_point(self, x: int, y: int, z: int):
         self.points.append((x, y, z))
+        self.fingerprint = None
+        self.distance_counts = None
+        self.rotated_points = None
+
+    def get_fingerprint(self) -> List[Counter]:
+        """
+        For each point, the squared distances to all the other points, counted
+        so that two points the same distance away are both kept.
+        Distances don't change when a scanner is turned or moved, so these can
+        be compared between scanners without knowing how they are aligned.
+        """
+        if self.fingerprint is None:
+            self.fingerprint = [
+                Counter(
+                    (ax - bx) ** 2 + (ay - by) ** 2 + (az - bz) ** 2
+                    for b_idx, (bx, by, bz) in enumerate(self.points)
+                    if a_idx != b_idx
+                )
+                for a_idx, (ax, ay, az) in enumerate(self.points)
+            ]
+        return self.fingerprint
+
+    def get_distance_counts(self) -> Counter:
+        """
+        Every point's fingerprint added together
+        """
+        if self.distance_counts is None:
+            self.distance_counts = Counter()
+            for this_fingerprint in self.get_fingerprint():
+                self.distance_counts.update(this_fingerprint)
+        return self.distance_counts
+
+    def candidate_pairs(self, other) -> List[Tuple[int, int]]:
+        """
+        Which (our point index, other point index) pairs could be the same beacon ?
+        A shared beacon sees the other shared beacons at the same distances from
+        both scanners, so it needs at least OVERLAP_NEEDED - 1 distances in common.
+
+        An empty list means the scanners cannot overlap enough to align.
+        """
+        needed = OVERLAP_NEEDED - 1
+        our_fingerprint = self.get_fingerprint()
+        other_fingerprint = other.get_fingerprint()
+
+        # quick reject, enough shared beacons means enough shared distances
+        shared_distances = self.get_distance_counts() & other.get_distance_counts()
+        shared = sum(shared_distances.values())
+        if shared < OVERLAP_NEEDED * needed:
+            return []
+
+        result = list()
+        other_keys = [set(theirs) for theirs in other_fingerprint]
+        for our_idx, ours in enumerate(our_fingerprint):
+            our_keys = set(ours)
+            repeats = len(self.points) - 1 - len(our_keys)
+            for other_idx, theirs in enumerate(other_fingerprint):
+                common = our_keys & other_keys[other_idx]
+                if len(common) >= needed:
+                    result.append((our_idx, other_idx))
+                elif repeats and len(common) + repeats >= needed:
+                    # only worth counting repeats if there are enough of them
+                    if sum(min(ours[d], theirs[d]) for d in common) >= needed:
+                        result.append((our_idx, other_idx))
+        # and we need enough beacons on both sides
+        if len({p[0] for p in result}) < OVERLAP_NEEDED:
+            return []
+        if len({p[1] for p in result}) < OVERLAP_NEEDED:
+            return []
+        return result
 
     def get_points(self, configuration=None):
         """
@@ -457,26 +570,30 @@ class Scanner:
         if configuration is None:
             configuration = self.config_idx
 
-        result = list()
-        for this_point in self.points:
-            x = this_point[self.configurations[configuration][0]]
-            y = this_point[self.configurations[configuration][1]]
-            z = this_point[self.configurations[configuration][2]]
-            if self.configurations[configuration][3]:
-                x = -x
-            if self.configurations[configuration][4]:
-                y = -y
-            if self.configurations[configuration][5]:
-                z = -z
-
-            # and apply our starting offsets..
-            if self.x is not None:
-                x += self.x
-                y += self.y
-                z += self.z
-
-            result.append((x, y, z))
-        return result
+        rotated = self.get_rotated_points()[configuration]
+
+        # and apply our starting offsets..
+        if self.x is not None:
+            return [(x + self.x, y + self.y, z + self.z) for x, y, z in rotated]
+        return list(rotated)
+
+    def get_rotated_points(self) -> List[List[Tuple[int, int, int]]]:
+        """
+        The points turned into each configuration, worked out once and kept
+        """
+        if self.rotated_points is None:
+            self.rotated_points = list()
+            for x_axis, y_axis, z_axis, x_flip, y_flip, z_flip in self.configurations:
+                x_sign = -1 if x_flip else 1
+                y_sign = -1 if y_flip else 1
+                z_sign = -1 if z_flip else 1
+                self.rotated_points.append(
+                    [
+                        (p[x_axis] * x_sign, p[y_axis] * y_sign, p[z_axis] * z_sign)
+                        for p in self.points
+                    ]
+                )
+        return self.rotated_points
 
     def get_configuration_index_range(self):
         return range(len(self.configurations))
@@ -505,45 +622,104 @@ class Scanner:
         Try and see whether there is an alignment and offset that hits at least 12 matches
         Assuming that the rotation and ordering and location of this scanner is correct
         """
+        alignment = self.find_alignment(other)
+        if alignment is None:
+            # well that was a bust..
+            return False
+
+        print(f"Solved a match!")
+        config_index, location = alignment
+        other.set_configuration(config_index)
+        other.set_location(*location)
+        return True
+
+    def find_alignment(self, other) -> Optional[Tuple[int, Tuple[int, int, int]]]:
+        """
+        Work out the (configuration index, location) that lines other up with
+        at least 12 of our points, without changing either scanner.
+        Returns None if there isn't one
+        """
+        candidates = self.candidate_pairs(other)
+        if not candidates:
+            # the fingerprints say there's no point trying
+            return None
+
         our_points = self.get_points()
         our_points_set = set(our_points)
         for config_index in other.get_configuration_index_range():
             # get the base list for this configuration
-            other_points = other.get_points(config_index)
-            # ok, so we need to try and match each of these points with all of our points..
-            for our_point in our_points:
-                for other_point in other_points:
-                    # so, to make this work we will need to calculate the offset that we would have to apply to make these two the same
-                    # our_points are absolute universe coordinates, so 100, 100, 100 is just that, the points have been translated.
-                    # given we know the configuration has been applied to other, we just need to do the maths:
-                    # an absolute correct coordinate of say 1000, with a -200 value in other means we need a 1200 starting point for other
-                    # therefore other.x_position := our.x - other_point.x
-                    x_position = our_point[0] - other_point[0]
-                    y_position = our_point[1] - other_point[1]
-                    z_position = our_point[2] - other_point[2]
-                    #
-                    #  ok, cool.. let's create an adjusted points list for the other scanner
-                    #
-                    adjusted_other_points = [
-                        (x + x_position, y + y_position, z + z_position)
-                        for x, y, z in other_points
-                    ]
-                    adjusted_other_points_set = set(adjusted_other_points)
-                    # how many match now ?
-                    matching = our_points_set.intersection(adjusted_other_points_set)
-                    if len(matching) >= 12:
-                        print(f"Solved a match!")
-                        other.set_configuration(config_index)
-                        other.set_location(x_position, y_position, z_position)
-                        return True
-
-        # well that was a bust..
-        return False
+            other_points = other.get_rotated_points()[config_index]
+            # so, to make a pair of points the same we would have to place other
+            # at our point - other point. Every real match agrees on where that is,
+            # so count the offsets and only try the most popular one.
+            offsets = Counter(
+                (
+                    our_points[our_idx][0] - other_points[other_idx][0],
+                    our_points[our_idx][1] - other_points[other_idx][1],
+                    our_points[our_idx][2] - other_points[other_idx][2],
+                )
+                for our_idx, other_idx in candidates
+            )
+            offset, votes = offsets.most_common(1)[0]
+            if votes < OVERLAP_NEEDED:
+                continue
+
+            # double check against the full point lists
+            x_position, y_position, z_position = offset
+            adjusted_other_points_set = {
+                (x + x_position, y + y_position, z + z_position)
+                for x, y, z in other_points
+            }
+            # how many match now ?
+            matching = our_points_set.intersection(adjusted_other_points_set)
+            if len(matching) >= OVERLAP_NEEDED:
+                return config_index, offset
+
+        return None
+
+
+# a worker process's own copy of every scanner, see share_scanners()
+shared_scanners = dict()
+
+
+def share_scanners(points: Dict[int, List[Tuple[int, int, int]]]):
+    """
+    Process pool initializer, each worker builds its scanners once from the
+    raw points so their fingerprints and rotations are worked out at most
+    once per worker rather than once per comparison
+    """
+    global shared_scanners
+    shared_scanners = dict()
+    for scanner_number, these_points in points.items():
+        scanner = Scanner(scanner_number)
+        for this_point in these_points:
+            scanner.add_point(*this_point)
+        shared_scanners[scanner_number] = scanner
+
+
+def find_shared_alignment(
+    base_number: int,
+    config_index: int,
+    location: Tuple[int, int, int],
+    target_number: int,
+) -> Optional[Tuple[int, Tuple[int, int, int]]]:
+    """
+    Scanner.find_alignment() between two of this worker's scanners, placing
+    the base one where the parent process has it first
+    """
+    base = shared_scanners[base_number]
+    base.set_configuration(config_index)
+    base.set_location(*location)
+    return base.find_alignment(shared_scanners[target_number])
 
 
 class ScannerField:
     def __init__(self):
         self.scanners = dict()
+        # every beacon from every situated scanner, see pack_point()
+        self.beacons = set()
+        # and which scanners those came from
+        self.recorded = set()
 
     def load_file(self, filename: str):
         with open(filename, "r") as f:
@@ -581,50 +757,136 @@ class ScannerField:
     def get_situated(self):
         return [s for s in self.scanners.values() if s.situated()]
 
+    def record_beacons(self, scanner: Scanner):
+        """
+        Add a newly situated scanner's beacons to the field
+        """
+        self.beacons.update(pack_point(*p) for p in scanner.get_points())
+        self.recorded.add(scanner.scanner_number)
+
     def count_points(self):
+        if len(self.recorded) == len(self.scanners):
+            return len(self.beacons)
+        # not everything has been through align_scanners(), so count them
+        # all the long way
         all_points = set()
         for this_scanner in self.scanners.values():
-            these_points = set(this_scanner.get_points())
-            all_points.update(these_points)
+            all_points.update(this_scanner.get_points())
         return len(all_points)
 
     def largest_manhattan_distance(self):
         """
         What is the largest manhattan distance between any two scanners..
+        |dx| + |dy| + |dz| is the biggest of (+/-dx +/-dy +/-dz), so it's the
+        widest spread of x+y+z, x+y-z, x-y+z or x-y-z over all the scanners
         """
+        situated = self.get_situated()
         best_manhattan = 0
-        for a in self.scanners.values():
-            for b in self.scanners.values():
-                this_manhattan = a.calculate_manhattan_to(b)
-                if this_manhattan > best_manhattan:
-                    print(f"New best Manhattan is {this_manhattan} between {a} and {b}")
-                    best_manhattan = this_manhattan
+        for y_sign, z_sign in ((1, 1), (1, -1), (-1, 1), (-1, -1)):
+            projections = [s.x + y_sign * s.y + z_sign * s.z for s in situated]
+            best_manhattan = max(best_manhattan, max(projections) - min(projections))
         return best_manhattan
 
-    def align_scanners(self):
+    def align_scanners(self, workers: int = 0):
         """
         Figure out which scanners live where
+        With workers set the comparisons are spread over that many processes
         """
+        if workers > 0:
+            self.align_scanners_in_parallel(workers)
+            return
+
         # Setup an initial scanner..
         self.scanners[0].set_location(0, 0, 0)
-
-        # Keep on correlating until we're done
-        compared = set()
-        while not self.situated():
-            # loop through all the unsituated scanners and try to situate them..
-            unsituated = self.get_unsituated()
-            situated = self.get_situated()
-            print(
-                f"Top of the loop, need to situate {len(unsituated)} against {len(situated)}"
-            )
+        self.record_beacons(self.scanners[0])
+
+        # Work outwards from each newly situated scanner, only trying it against
+        # the ones still floating, so every pair gets compared at most once
+        unsituated = self.get_unsituated()
+        newly_situated = deque([self.scanners[0]])
+        self.alignment_attempts = 0
+        while unsituated and newly_situated:
+            this_base = newly_situated.popleft()
+            still_unsituated = list()
             for this_target in unsituated:
-                for this_base in situated:
-                    key = (this_target.scanner_number, this_base.scanner_number)
-                    if key not in compared:
-                        compared.add(key)
-                        print(f"Trying to align {this_target} against {this_base}")
-                        if this_base.align_other(this_target):
-                            break
+                print(f"Trying to align {this_target} against {this_base}")
+                self.alignment_attempts += 1
+                if this_base.align_other(this_target):
+                    self.record_beacons(this_target)
+                    newly_situated.append(this_target)
+                else:
+                    still_unsituated.append(this_target)
+            unsituated = still_unsituated
+
+        print(f"align_scanners: {self.alignment_attempts} alignment attempts")
+        if unsituated:
+            numbers = sorted(s.scanner_number for s in unsituated)
+            raise ValueError(f"Unable to situate scanners {numbers}")
+
+    def align_scanners_in_parallel(self, workers: int):
+        """
+        Hand every (unsituated, situated) pair to a process pool. As soon as a
+        scanner is situated any outstanding work for it is cancelled and it is
+        queued up against everything that is still floating.
+        """
+        # Setup an initial scanner..
+        self.scanners[0].set_location(0, 0, 0)
+        self.record_beacons(self.scanners[0])
+        unsituated = {s.scanner_number for s in self.get_unsituated()}
+        pending = dict()
+        # submitted comparisons, less any cancelled before they started
+        self.alignment_attempts = 0
+
+        # only the raw points go to the workers, once each
+        points = {n: scanner.points for n, scanner in self.scanners.items()}
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=share_scanners, initargs=(points,)
+        ) as executor:
+
+            def submit_against(base: Scanner):
+                location = (base.x, base.y, base.z)
+                for target_number in unsituated:
+                    future = executor.submit(
+                        find_shared_alignment,
+                        base.scanner_number,
+                        base.config_idx,
+                        location,
+                        target_number,
+                    )
+                    pending[future] = (target_number, base.scanner_number)
+                    self.alignment_attempts += 1
+
+            submit_against(self.scanners[0])
+            while unsituated and pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    target_number, base_number = pending.pop(future)
+                    if target_number not in unsituated:
+                        # someone else got there first
+                        continue
+                    alignment = future.result()
+                    if alignment is None:
+                        continue
+
+                    target = self.scanners[target_number]
+                    print(f"Aligned {target_number} against {base_number}")
+                    config_index, location = alignment
+                    target.set_configuration(config_index)
+                    target.set_location(*location)
+                    self.record_beacons(target)
+                    unsituated.discard(target_number)
+
+                    # don't waste time on the rest of this one's comparisons
+                    for other_future, (other_target, _) in list(pending.items()):
+                        if other_target == target_number and other_future.cancel():
+                            del pending[other_future]
+                            self.alignment_attempts -= 1
+
+                    submit_against(target)
+
+        print(f"align_scanners: {self.alignment_attempts} alignment attempts")
+        if unsituated:
+            raise ValueError(f"Unable to situate scanners {sorted(unsituated)}")
 
 
 def part1(filename: str):
@@ -648,7 +910,7 @@ def part2(filename: str):
 def silly():
     s = Scanner(999)
     s.add_point(1, 2, 3)
-    for idx in range(48):
+    for idx in s.get_configuration_index_range():
         l = s.get_points(idx)
         print(l)
     exit(1)
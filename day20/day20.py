@@ -105,6 +105,36 @@
 # Start with the original input image and apply the image enhancement algorithm twice, being careful to account for the infinite size of the images. How many pixels are lit in the resulting image?
 
 
+from typing import List
+
+# every bit of a byte moved 3 bits apart, so 0b101 becomes 0b001000001
+SPREAD_BYTE = [sum(((b >> i) & 1) << (3 * i) for i in range(8)) for b in range(256)]
+
+
+def spread_bits(value: int) -> int:
+    """
+    Move bit n of the value to bit 3n
+    """
+    result = 0
+    shift = 0
+    while value:
+        result |= SPREAD_BYTE[value & 0xFF] << shift
+        value >>= 8
+        shift += 24
+    return result
+
+
+def transpose_index(index: int) -> int:
+    """
+    Swap the rows and columns of a 3x3 9-bit index
+    """
+    result = 0
+    for column in (2, 1, 0):
+        for row in (6, 3, 0):
+            result = (result << 1) | ((index >> (row + column)) & 1)
+    return result
+
+
 class Enhancer:
     def __init__(self, enhancer: str) -> None:
         assert len(enhancer) == 512
@@ -112,6 +142,13 @@ class Enhancer:
         for idx, val in enumerate(enhancer):
             if val == "#":
                 self.yields_lit.add(idx)
+        # the same thing as a 512 entry lookup table of 0 / 1 values
+        self.table = bytes(1 if val == "#" else 0 for val in enhancer)
+        # and again, indexed by 3 columns of (above, middle, below) bits
+        # rather than 3 rows of (left, middle, right) bits
+        self.column_table = bytes(
+            self.table[transpose_index(index)] for index in range(512)
+        )
 
     def pixel_for(self, index):
         """
@@ -213,7 +250,259 @@ class Image:
         return result
 
 
-def partx(filename: str, enhancement_count: int):
+class PixelGrid:
+    """
+    Dense version of Image, a list of rows of 0 / 1 bytes with the top left
+    at (min_x, min_y). Everything outside the rows is the background value.
+
+    Enhancing works on whole rows at a time, each row is turned into its
+    3-bit horizontal windows once and then three neighbouring rows of those
+    are combined into the 9-bit enhancer indexes for a complete output row.
+    """
+
+    def __init__(self, rows: List[bytearray], min_x=0, min_y=0, background=0):
+        self.rows = rows
+        self.min_x = min_x
+        self.min_y = min_y
+        self.background = background
+
+    @staticmethod
+    def from_image(image: Image) -> "PixelGrid":
+        rows = []
+        for y in range(image.min_y, image.max_y + 1):
+            rows.append(
+                bytearray(
+                    1 if (x, y) in image.pixels else 0
+                    for x in range(image.min_x, image.max_x + 1)
+                )
+            )
+        background = 1 if image.out_of_bounds_default else 0
+        return PixelGrid(rows, image.min_x, image.min_y, background)
+
+    def to_image(self) -> Image:
+        image = Image()
+        for y_offset, row in enumerate(self.rows):
+            for x_offset, val in enumerate(row):
+                if val:
+                    image.set_pixel(self.min_x + x_offset, self.min_y + y_offset)
+        image.out_of_bounds_default = bool(self.background)
+        return image
+
+    def count_lit_pixels(self):
+        """
+        How many are lit ? (ignoring the background)
+        """
+        return sum(sum(row) for row in self.rows)
+
+    def enhance(self, enhancer: Enhancer) -> "PixelGrid":
+        """
+        Use the enhancer to create a new, enhanced grid 1 pixel bigger on
+        every side
+        """
+        background = self.background
+        width = len(self.rows[0]) if self.rows else 0
+        table = enhancer.table
+
+        # pad by 2 so that every output pixel has a full 3x3 of inputs
+        edge = bytes([background]) * 2
+        blank = bytes([background]) * (width + 4)
+        padded = [blank, blank]
+        padded.extend(edge + row + edge for row in self.rows)
+        padded.extend([blank, blank])
+
+        # 3-bit windows across each row, one per output column
+        windows = [
+            [(a << 2) | (b << 1) | c for a, b, c in zip(row, row[1:], row[2:])]
+            for row in padded
+        ]
+
+        # and stack three rows of windows into the 9-bit index
+        new_rows = [
+            bytearray(
+                table[(above << 6) | (middle << 3) | below]
+                for above, middle, below in zip(*windows[y : y + 3])
+            )
+            for y in range(len(self.rows) + 2)
+        ]
+
+        # the infinite background is all 0s or all 1s
+        new_background = table[511 if background else 0]
+        return PixelGrid(new_rows, self.min_x - 1, self.min_y - 1, new_background)
+
+    def enhance_many(self, enhancer: Enhancer, generations: int) -> "PixelGrid":
+        """
+        Enhance a number of times in one go.
+
+        Rather than a new grid per generation this uses two flat buffers, each
+        big enough for the final image plus a 1 pixel border, and bounces
+        between them. Generation g lives in the middle of the buffer, inset by
+        (generations - g + 1) on every side, and everything just outside it is
+        rewritten to the current background before it is read.
+        """
+        table = enhancer.table
+        background = self.background
+        height = len(self.rows)
+        width = len(self.rows[0]) if self.rows else 0
+        buffer_width = width + 2 * generations + 2
+        buffer_height = height + 2 * generations + 2
+
+        source = bytearray([background]) * (buffer_width * buffer_height)
+        target = bytearray(len(source))
+        inset = generations + 1
+        for y, row in enumerate(self.rows):
+            start = (inset + y) * buffer_width + inset
+            source[start : start + width] = row
+
+        for _ in range(generations):
+            # the active area of the source, [low, high) both ways
+            low_x = inset
+            high_x = buffer_width - inset
+            low_y = inset
+            high_y = buffer_height - inset
+
+            # clear the 2 pixel ring around it back to the background
+            fill = bytes([background])
+            ring_width = high_x - low_x + 4
+            for y in (low_y - 2, low_y - 1, high_y, high_y + 1):
+                start = y * buffer_width + low_x - 2
+                source[start : start + ring_width] = fill * ring_width
+            for y in range(low_y, high_y):
+                start = y * buffer_width
+                source[start + low_x - 2 : start + low_x] = fill * 2
+                source[start + high_x : start + high_x + 2] = fill * 2
+
+            # and write the area 1 bigger into the target
+            view = memoryview(source)
+            out_width = high_x - low_x + 2
+
+            def windows_for(y: int) -> List[int]:
+                start = y * buffer_width + low_x - 2
+                row = view[start : start + out_width + 2]
+                return [
+                    (a << 2) | (b << 1) | c for a, b, c in zip(row, row[1:], row[2:])
+                ]
+
+            above = windows_for(low_y - 2)
+            middle = windows_for(low_y - 1)
+            for y in range(low_y - 1, high_y + 1):
+                below = windows_for(y + 1)
+                start = y * buffer_width + low_x - 1
+                target[start : start + out_width] = bytes(
+                    table[(a << 6) | (m << 3) | b]
+                    for a, m, b in zip(above, middle, below)
+                )
+                above, middle = middle, below
+            view.release()
+
+            background = table[511 if background else 0]
+            source, target = target, source
+            inset -= 1
+
+        # and pull out the final image
+        final_width = width + 2 * generations
+        rows = []
+        for y in range(height + 2 * generations):
+            start = (inset + y) * buffer_width + inset
+            rows.append(source[start : start + final_width])
+        return PixelGrid(
+            rows, self.min_x - generations, self.min_y - generations, background
+        )
+
+
+class BitRowImage:
+    """
+    Another version of Image with each row held as a single int, the left
+    most pixel being the most significant bit. Everything outside the rows
+    is the background value.
+
+    Three neighbouring rows are interleaved into one int with a 3-bit group
+    per column, so each 9-bit window is just a shift and a mask, and the
+    window for the next pixel comes from shifting along by one group. Each
+    input row is only spread out once, for all three output rows it touches.
+    """
+
+    def __init__(self, rows: List[int], width: int, min_x=0, min_y=0, background=0):
+        self.rows = rows
+        self.width = width
+        self.min_x = min_x
+        self.min_y = min_y
+        self.background = background
+
+    @staticmethod
+    def from_image(image: Image) -> "BitRowImage":
+        rows = []
+        for y in range(image.min_y, image.max_y + 1):
+            row = 0
+            for x in range(image.min_x, image.max_x + 1):
+                row = (row << 1) | (1 if (x, y) in image.pixels else 0)
+            rows.append(row)
+        width = image.max_x - image.min_x + 1
+        background = 1 if image.out_of_bounds_default else 0
+        return BitRowImage(rows, width, image.min_x, image.min_y, background)
+
+    def to_image(self) -> Image:
+        image = Image()
+        for y_offset, row in enumerate(self.rows):
+            for x_offset in range(self.width):
+                if (row >> (self.width - 1 - x_offset)) & 1:
+                    image.set_pixel(self.min_x + x_offset, self.min_y + y_offset)
+        image.out_of_bounds_default = bool(self.background)
+        return image
+
+    def count_lit_pixels(self):
+        """
+        How many are lit ? (ignoring the background)
+        """
+        return sum(bin(row).count("1") for row in self.rows)
+
+    def enhance(self, enhancer: Enhancer) -> "BitRowImage":
+        """
+        Use the enhancer to create a new, enhanced image 1 pixel bigger on
+        every side
+        """
+        background = self.background
+        table = enhancer.column_table
+
+        # pad by 2 so that every output pixel has a full 3x3 of inputs
+        padded_width = self.width + 4
+        edge = 0b11 if background else 0
+        blank = (1 << padded_width) - 1 if background else 0
+        padded = [blank, blank]
+        padded.extend((((edge << self.width) | row) << 2) | edge for row in self.rows)
+        padded.extend([blank, blank])
+        spread = [spread_bits(row) for row in padded]
+
+        new_rows = []
+        for y in range(len(self.rows) + 2):
+            # above, middle and below bits for each column, right most first
+            columns = (spread[y] << 2) | (spread[y + 1] << 1) | spread[y + 2]
+            new_row = 0
+            for bit in range(padded_width - 2):
+                new_row |= table[columns & 0x1FF] << bit
+                columns >>= 3
+            new_rows.append(new_row)
+
+        # the infinite background is all 0s or all 1s
+        new_background = enhancer.table[511 if background else 0]
+        return BitRowImage(
+            new_rows, self.width + 2, self.min_x - 1, self.min_y - 1, new_background
+        )
+
+    def enhance_many(self, enhancer: Enhancer, generations: int) -> "BitRowImage":
+        """
+        Enhance this many times over
+        """
+        image = self
+        for _ in range(generations):
+            image = image.enhance(enhancer)
+        return image
+
+
+# the ways partx() can do the enhancing
+ENGINES = {"grid": PixelGrid, "bits": BitRowImage}
+
+
+def partx(filename: str, enhancement_count: int, engine: str = "grid"):
     # Load the input and get an enhancer and initial image
     enhancer = None
     image = Image()
@@ -235,12 +524,13 @@ def partx(filename: str, enhancement_count: int):
                     y += 1
     image.print()
 
-    # enhance it twice..
-    for i in range(enhancement_count):
-        image = image.enhance(enhancer)
+    # enhance it as many times as needed..
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine}, pick one of {sorted(ENGINES)}")
+    grid = ENGINES[engine].from_image(image).enhance_many(enhancer, enhancement_count)
 
     # and count the lit pixels
-    result = image.count_lit_pixels()
+    result = grid.count_lit_pixels()
     return result
 
 
@@ -259,6 +549,13 @@ if __name__ == "__main__":
     print(f"Puzzle1 is {puzz1}")
     assert puzz1 == puzz1_expected
 
+    # the bit row engine should agree with the grid one
+    test1_bits = partx(test_filename, 2, "bits")
+    puzz1_bits = partx(puzzle_filename, 2, "bits")
+    print(f"Bit rows got {test1_bits} and {puzz1_bits}")
+    assert test1_bits == test1_expected
+    assert puzz1_bits == puzz1_expected
+
     test2 = partx(test_filename, 50)
     print(f"Test2 got {test2}, expected {test2_expected}")
     assert test2 == test2_expected
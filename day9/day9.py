@@ -38,6 +38,36 @@
 # Find all of the low points on your heightmap. What is the sum of the risk
 # levels of all low points on your heightmap?
 import math
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from digit_grid import load_digit_grid  # noqa: E402
+
+# the top bit of a byte, lower_than() marks its answers with it
+LANE_HIGH_BIT = b"\x80"
+# depth -> printable character, 10 is a missing spot
+DEPTH_CHARS = bytes.maketrans(bytes(range(11)), b"0123456789.")
+# turns the 9s into missing spots
+REMOVE_HIGH_GROUND = bytes.maketrans(b"\x09", b"\x0a")
+
+
+def lower_than(these, those) -> int:
+    """
+    Compare two equal length runs of depths (0-10) all at once. Each is read
+    as one big int with a byte per depth, and the answer has 0x80 set in
+    each byte where this depth is lower than that one.
+    Setting the top bit of every byte of those before subtracting these + 1
+    stops any byte borrowing from its neighbour, so the top bit survives
+    exactly where those - these - 1 >= 0.
+    """
+    count = len(these)
+    high_bits = int.from_bytes(LANE_HIGH_BIT * count, "big")
+    ones = int.from_bytes(b"\x01" * count, "big")
+    difference = (int.from_bytes(those, "big") | high_bits) - (
+        int.from_bytes(these, "big") + ones
+    )
+    return difference & high_bits
 
 
 def leftof(location):
@@ -67,49 +97,53 @@ class CavernFloor:
             self.load_floor_from_file(filename)
 
     def _reset(self):
-        self.spots = dict()
+        # depths row by row with a border of 10s all the way round (10 also
+        # marks a missing spot) so that every real spot has four neighbours,
+        # (x, y) lives at (y - min_y + 1) * padded_width + (x - min_x + 1)
+        self.heights = bytearray()
+        self.padded_width = 2
         self.min_x = 0
-        self.max_x = 0
+        self.max_x = -1
         self.min_y = 0
-        self.max_y = 0
+        self.max_y = -1
 
-    def _ensure_bounds(self, x, y):
-        self.min_x = min(self.min_x, x)
-        self.min_y = min(self.min_y, y)
-        self.max_x = max(self.max_x, x)
-        self.max_y = max(self.max_y, y)
-
-    def _set_location_depth(self, x: int, y: int, depth: int):
+    def _index_of(self, x: int, y: int):
         """
-        Store one floor depth correctly
+        Where a location lives in heights, or None if it's off the floor
         """
-        self.spots[(x, y)] = depth
-        self._ensure_bounds(x, y)
+        if self.min_x <= x <= self.max_x and self.min_y <= y <= self.max_y:
+            return (y - self.min_y + 1) * self.padded_width + (x - self.min_x + 1)
+        return None
 
     def _get_depth_str(self, x, y):
         """
         Return the depth string or '.' if missing
         """
-        key = (x, y)
-        if key in self.spots:
-            result = str(self.spots[key])
-        else:
-            result = "."
-        return result
+        depth = self._get_value_at_location((x, y))
+        if depth is None:
+            return "."
+        return str(depth)
 
     def load_floor_from_file(self, filename: str):
         """
         Load a fresh floor from the file specified
         """
-        self.spots = dict()
-        with open(filename, "r") as f:
-            this_y = 0
-            for this_line in f:
-                this_line = this_line.strip()
-                if "" != this_line:
-                    for this_x, this_depth_str in enumerate(this_line):
-                        self._set_location_depth(this_x, this_y, int(this_depth_str))
-                    this_y += 1
+        self.load_floor_from_buffer(*load_digit_grid(filename))
+
+    def load_floor_from_buffer(self, buffer: bytes, width: int, height: int):
+        """
+        Load a fresh floor from a flat buffer of depths, row by row
+        """
+        self._reset()
+        if 0 == width or 0 == height:
+            return
+        self.padded_width = width + 2
+        self.max_x = width - 1
+        self.max_y = height - 1
+        self.heights = bytearray([10]) * (self.padded_width * (height + 2))
+        for y in range(height):
+            start = (y + 1) * self.padded_width + 1
+            self.heights[start : start + width] = buffer[y * width : (y + 1) * width]
 
     def _is_low_point(self, location) -> bool:
         """
@@ -127,11 +161,39 @@ class CavernFloor:
         return True
 
     def _get_value_at_location(self, location, default=None) -> int:
-        if location in self.spots:
-            result = self.spots[location]
-        else:
-            result = default
-        return result
+        idx = self._index_of(*location)
+        if idx is None or 10 == self.heights[idx]:
+            return default
+        return self.heights[idx]
+
+    def _low_point_indexes(self):
+        """
+        Returns (heights, padded width, low point indexes into heights)
+        Rather than visiting each spot and its neighbours, the whole floor
+        is lined up against itself shifted left, right, up and down and
+        compared all at once, see lower_than().
+        """
+        heights = self.heights
+        width = self.padded_width
+        if not heights:
+            return heights, width, []
+        view = memoryview(heights)
+        end = len(heights) - width - 1
+        centre = view[width + 1 : end]
+        lower = (
+            lower_than(centre, view[width : end - 1])
+            & lower_than(centre, view[width + 2 : end + 1])
+            & lower_than(centre, view[1 : end - width])
+            & lower_than(centre, view[2 * width + 1 : end + width])
+        )
+        # only the low points themselves get visited in python
+        marks = lower.to_bytes(len(centre), "big")
+        low_points = list()
+        idx = marks.find(LANE_HIGH_BIT)
+        while -1 != idx:
+            low_points.append(idx + width + 1)
+            idx = marks.find(LANE_HIGH_BIT, idx + 1)
+        return heights, width, low_points
 
     def calculate_low_risk(self):
         """
@@ -139,21 +201,18 @@ class CavernFloor:
         For each spot on the map, if it is lower than its orthagonal existing neighbours,
         then increment the total by 1+the depth of that spot
         """
-        total = 0
-        for this_location in self.spots:
-            if self._is_low_point(this_location):
-                total += 1 + self._get_value_at_location(this_location)
-        return total
+        heights, _, low_points = self._low_point_indexes()
+        return sum(heights[idx] for idx in low_points) + len(low_points)
 
     def find_low_points(self):
         """
         Return a list of low-point locations
         """
-        result = []
-        for this_location in self.spots:
-            if self._is_low_point(this_location):
-                result.append(this_location)
-        return result
+        _, width, low_points = self._low_point_indexes()
+        return [
+            (idx % width - 1 + self.min_x, idx // width - 1 + self.min_y)
+            for idx in low_points
+        ]
 
     def _find_places_from_here(self, location, already_seen):
         """
@@ -163,7 +222,7 @@ class CavernFloor:
         if location in already_seen:
             return 0
         # never seen this place.. cool... is it a valid place ?
-        if location not in self.spots:
+        if self._get_value_at_location(location) is None:
             return 0
         # it is a valid place - sold..
         already_seen.add(location)
@@ -183,22 +242,61 @@ class CavernFloor:
         total = self._find_places_from_here(location, places_we_have_seen)
         return total
 
+    def find_all_basin_sizes(self):
+        """
+        Label every basin in a single pass across the floor and return all
+        of their sizes.
+        Each spot is joined up (union-find) with the spots to its left and
+        above it, unless either is a 9 or missing, and then the spots are
+        counted by the basin they ended up in. No recursion, so a basin of
+        any size is fine.
+        """
+        heights = self.heights
+        width = self.padded_width
+        parent = list(range(len(heights)))
+
+        def find(idx: int) -> int:
+            while parent[idx] != idx:
+                # halve the path as we go
+                parent[idx] = parent[parent[idx]]
+                idx = parent[idx]
+            return idx
+
+        def union(a: int, b: int):
+            root_a = find(a)
+            root_b = find(b)
+            if root_a != root_b:
+                parent[root_b] = root_a
+
+        # the border is all 10s, so every spot has someone to its left and
+        # above it and nothing outside the floor ever joins a basin
+        for idx, depth in enumerate(heights):
+            if depth >= 9:
+                continue
+            if heights[idx - 1] < 9:
+                union(idx - 1, idx)
+            if heights[idx - width] < 9:
+                union(idx - width, idx)
+
+        sizes = dict()
+        for idx, depth in enumerate(heights):
+            if depth < 9:
+                root = find(idx)
+                sizes[root] = sizes.get(root, 0) + 1
+        return list(sizes.values())
+
     def remove_high_ground(self):
         """
         Get rid of anything that's a 9
         """
-        for x in range(self.min_x, self.max_x + 1):
-            for y in range(self.min_y, self.max_y + 1):
-                if 9 == self.spots[(x, y)]:
-                    del self.spots[(x, y)]
+        self.heights = self.heights.translate(REMOVE_HIGH_GROUND)
 
     def __repr__(self) -> str:
         result = f"CavernFloor [{self.max_x - self.min_x + 1}x{self.max_y - self.min_y + 1}] ({self.min_x},{self.min_y})-({self.max_x},{self.max_y})\n"
         for y in range(self.min_y, self.max_y + 1):
-            s = ""
-            for x in range(self.min_x, self.max_x + 1):
-                s += self._get_depth_str(x, y)
-            result += f"{s}\n"
+            start = self._index_of(self.min_x, y)
+            row = self.heights[start : start + self.max_x - self.min_x + 1]
+            result += row.translate(DEPTH_CHARS).decode() + "\n"
         return result
 
 
@@ -219,11 +317,7 @@ def part2(filename: str) -> int:
     Solve part2
     """
     cave = CavernFloor(filename)
-    low_points = cave.find_low_points()
-    cave.remove_high_ground()
-    print(cave)
-    print(low_points)
-    basin_sizes = [cave.find_basin_size(location) for location in low_points]
+    basin_sizes = cave.find_all_basin_sizes()
     print(basin_sizes)
     sorted_sizes = sorted(basin_sizes, reverse=True)
     print(sorted_sizes)
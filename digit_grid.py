@@ -0,0 +1,72 @@
+"""
+Shared loader for the days whose puzzle input is a rectangle of digits
+(day9, day11, day15). The day scripts put the repository root on sys.path
+before importing this, see the top of each of them.
+"""
+import mmap
+import os
+from typing import Tuple
+
+# ascii digit -> digit value, everything else is left as-is
+DIGIT_VALUES = bytes.maketrans(b"0123456789", bytes(range(10)))
+
+# how much of the file gets translated at a time, roughly
+CHUNK_BYTES = 1 << 20
+
+
+def load_digit_grid(filename: str) -> Tuple[bytearray, int, int]:
+    """
+    Read a file of equal length lines of digits as one flat buffer of digit
+    values, row after row. Returns (buffer, width, height)
+    The file is memory mapped and converted a block of rows at a time with
+    bytes.translate, there's no per-character python work and the whole
+    file is never copied before it is converted.
+    Raises ValueError for ragged lines or anything other than digits.
+    """
+    with open(filename, "rb") as f:
+        if 0 == os.fstat(f.fileno()).st_size:
+            return bytearray(), 0, 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _convert_digit_grid(filename, data)
+
+
+def _convert_digit_grid(filename: str, data: mmap.mmap) -> Tuple[bytearray, int, int]:
+    first_line_end = data.find(b"\n")
+    if -1 == first_line_end:
+        first_line_end = len(data)
+    line_ending = b"\n"
+    width = first_line_end
+    if width > 0 and data[width - 1] == ord("\r"):
+        line_ending = b"\r\n"
+        width -= 1
+
+    # ignore any blank lines at the end, and the last line may not have a
+    # line ending of its own
+    size = len(data)
+    while size > 0 and data[size - 1] in b"\r\n":
+        size -= 1
+    stride = width + len(line_ending)
+    if 0 == width or 0 != (size + len(line_ending)) % stride:
+        raise ValueError(f"{filename} is not a rectangle of digits")
+    height = (size + len(line_ending)) // stride
+
+    buffer = bytearray(width * height)
+    rows_per_chunk = max(1, CHUNK_BYTES // stride)
+    for first_row in range(0, height, rows_per_chunk):
+        rows = min(rows_per_chunk, height - first_row)
+        start = first_row * stride
+        chunk = data[start : min(start + rows * stride, size)]
+        # every line has to end exactly where the first one did
+        for offset, end_byte in enumerate(line_ending):
+            line_ends = chunk[width + offset :: stride]
+            if line_ends.count(end_byte) != len(line_ends):
+                raise ValueError(f"{filename} is not a rectangle of digits")
+        digits = chunk.translate(None, line_ending)
+        if len(digits) != rows * width:
+            raise ValueError(f"{filename} is not a rectangle of digits")
+        if digits.translate(None, b"0123456789"):
+            raise ValueError(f"{filename} has something other than digits in it")
+        buffer[first_row * width : (first_row + rows) * width] = digits.translate(
+            DIGIT_VALUES
+        )
+    return buffer, width, height